@@ -2,112 +2,299 @@
 
 import os
 import sys
-import gzip
+import json
+import zlib
+import sqlite3
 import argparse
-from Bio import SeqIO
+from array import array
 from argparse import RawTextHelpFormatter
 
+import numpy as np
+
+import generic_utils as gu
+
 """
 Future updates:
     - Add a description in the script
     - TBD...
 """
 
+CHUNK_SIZE = 4 * 1024 * 1024  # Bytes read at once from the assembly
+CACHE_NAMESPACE = 'assembly_statistics.scan.v1'  # Change it with the format
+CURVE_STEPS = tuple(range(1, 101))  # x of the Nx curve, in %
+NX_COLUMNS = tuple(range(10, 100, 10))  # N10 ... N90
+COMPOSITION_KEYS = ('GC', 'AT', 'N', 'ambiguous', 'soft_masked')
+# Extensions of the assemblies taken from a directory
+ASSEMBLY_EXT = ('.fa', '.fasta', '.fna', '.fas', '.fsa')
+
+
+def _build_translation_table(default, classes):
+    """Return a bytes.translate() table, 'classes' maps a symbol class to
+    the characters it contains"""
+    table = bytearray(default * 256)
+    for symbol, chars in classes.items():
+        for char in chars:
+            table[char] = ord(symbol)
+    return bytes(table)
+
+
+# The composition kernel translates each byte into its class then counts the
+# classes; the translation is done without deletion as it is much faster
+BASE_CLASSES = _build_translation_table(b'X', {
+    'S': b'GCgc', 'W': b'ATUatu', 'N': b'Nn', '\n': b'\n\r\t\v\f '})
+CLASS_CODES = {name: ord(name) for name in 'SWN\n'}
+
+
+def count_composition(buf, counters):
+    """Add the base composition of a raw sequence buffer to the counters
+    and return the number of bases it contains.
+    The whole buffer is handled at once by bytes.translate() and NumPy
+    reductions, no Python loop is done per nucleotide"""
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    classes = np.frombuffer(buf.translate(BASE_CLASSES), dtype=np.uint8)
+    num = {name: int(np.count_nonzero(classes == code))
+           for name, code in CLASS_CODES.items()}
+    num_bases = len(classes) - num['\n']  # Drop the line breaks
+
+    counters['GC'] += num['S']
+    counters['AT'] += num['W']
+    counters['N'] += num['N']
+    counters['ambiguous'] += num_bases - num['S'] - num['W'] - num['N']
+    counters['soft_masked'] += int(np.count_nonzero((raw >= ord('a')) &
+                                                    (raw <= ord('z'))))
+    return num_bases
+
+
+def scan_assembly(asm, chunk_size=CHUNK_SIZE, threads=1):
+    """Read the assembly once, chunk by chunk, and return the length of each
+    contig plus the base composition counters. Sequences are never stored,
+    so the memory depends on the number of contigs, not on the assembly
+    size. 'threads' is used to decompress BGZF files.
+    The composition is counted once per chunk, on all its sequence segments
+    joined, so many short contigs do not cost one NumPy pass each; the
+    length of a segment is its size minus its line breaks"""
+    lengths = array('Q')  # 8 bytes per contig
+    counters = dict.fromkeys(COMPOSITION_KEYS, 0)
+    current = -1  # -1 until the first header is found
+    in_header = False
+
+    with gu.open_file(asm, 'rb', threads=threads) as fi:
+        while True:
+            chunk = fi.read(chunk_size)
+            if not chunk:
+                break
+
+            # The sequence segments of the chunk, None where a contig starts
+            events = []
+            pos, end = 0, len(chunk)
+            started = current >= 0
+            while pos < end:
+                if in_header:
+                    # Skip the defline, it can continue in the next chunk
+                    eol = chunk.find(b'\n', pos)
+                    if eol == -1:
+                        break
+                    in_header = False
+                    pos = eol + 1
+                    continue
+
+                # Sequence until the next header or the end of the chunk
+                nxt = chunk.find(b'>', pos)
+                stop = end if nxt == -1 else nxt
+                if started and stop > pos:
+                    events.append((pos, stop))
+
+                if nxt == -1:
+                    break
+                events.append(None)
+                started = True
+                in_header = True
+                pos = nxt + 1
+
+            segments = [event for event in events if event]
+            seq = b''.join(chunk[start:stop] for start, stop in segments)
+            num_bases = count_composition(seq, counters) if seq else 0
+            # Other whitespace than '\n' (e.g. '\r') is rare, it is then
+            # removed from each segment
+            only_lf = num_bases == len(seq) - seq.count(b'\n')
+
+            for event in events:
+                if event is None:  # A new contig starts, save the previous one
+                    if current >= 0:
+                        lengths.append(current)
+                    current = 0
+                elif only_lf:
+                    current += event[1] - event[0] - \
+                        chunk.count(b'\n', event[0], event[1])
+                else:
+                    current += len(chunk[event[0]:event[1]].translate(
+                        None, gu.SEQ_WHITESPACE))
+
+    if current >= 0:  # DO NOT FORGET THE LAST CONTIG
+        lengths.append(current)
+
+    return lengths, counters
+
+
+def _pack_scan(lengths, counters):
+    """Serialize the result of scan_assembly() for the cache"""
+    return json.dumps(counters).encode() + b'\n' + \
+        zlib.compress(lengths.tobytes())
+
+
+def _unpack_scan(payload):
+    """Read back a result of scan_assembly() stored in the cache"""
+    counters, lengths = payload.split(b'\n', 1)
+    return array('Q', zlib.decompress(lengths)), json.loads(counters)
+
+
+def cached_scan(asm, options):
+    """Run scan_assembly() through the persistent cache of the options
+    'cache' (None to disable it), 'cache_hash', 'cache_size' and 'refresh'.
+    'io_threads' is the number of threads to decompress the file.
+    Return the lengths, the counters, and True/False/None for a cache
+    hit/miss/not used"""
+    threads = options['io_threads']
+    if not options['cache'] or asm == '-':
+        return (*scan_assembly(asm, threads=threads), None)
 
-def is_gz_file(filepath):
-    with gzip.open(filepath, 'r') as fh:
-        try:
-            # Gzip file
-            fh.read(1)
-            return 'rt'
-        except gzip.BadGzipFile:
-            # regular file
-            return 'r'
-
-
-def fasta_to_seq_dict(asm):
-    """Return a dictionnary contig:sequence"""
-    read_mode = is_gz_file(asm)
-    contigs = dict()
-    if read_mode == 'rt':
-        fi = gzip.open(asm, read_mode)
-    else:
-        fi = open(asm, read_mode)
-
-    records = SeqIO.parse(fi, 'fasta')
-
-    # Get the list
-    for record in records:
-        contigs[record.id] = str(record.seq)
-    fi.close()
-
-    return contigs
+    try:
+        with gu.FileCache(options['cache'], max_size=options['cache_size'],
+                          content_hash=options['cache_hash']) as cache:
+            payload = None if options['refresh'] else \
+                cache.get(asm, namespace=CACHE_NAMESPACE)
+            if payload is not None:
+                return (*_unpack_scan(payload), True)
+
+            lengths, counters = scan_assembly(asm, threads=threads)
+            cache.put(asm, _pack_scan(lengths, counters),
+                      namespace=CACHE_NAMESPACE)
+            return lengths, counters, False
+
+    except (sqlite3.Error, OSError) as e:
+        # A broken, locked or unwritable cache must not prevent to get the
+        # statistics
+        print(f"Cache not used for {asm}: {e}", file=sys.stderr)
+        return (*scan_assembly(asm, threads=threads), None)
+
+
+def lengths_from_fai(asm, build=False):
+    """Return the contig lengths from the samtools index (.fai) of the
+    assembly, without reading the sequences. The index is used if it is up
+    to date, or built with 'build'. Return None if it cannot be used, e.g.
+    for a compressed assembly"""
+    if asm == '-' or not (build or gu.is_fai_fresh(asm)):
+        return None
+    try:
+        with gu.FastaIndex(asm) as index:
+            return array('Q', index.lengths())
+    except Exception:
+        return None
 
 
-def get_total_length(seq_d, contig_list=False):
+def get_total_length(lengths):
     """Return the assembly length"""
-    contigs_size = list()
-    total_length = 0
-
-    for contig, seq in seq_d.items():
-        total_length += len(seq)
-        contigs_size.append(len(seq))
-
-    if contig_list:
-        return total_length, contigs_size
+    return sum(lengths)
+
+
+def _quantiles(sizes, cumul_length, thresholds):
+    """Return the length and the rank of the first contig reaching each
+    threshold of cumulative length, 0 if the threshold is never reached"""
+    idx = np.searchsorted(cumul_length, thresholds, side='left')
+    reached = idx < len(sizes)
+    nx = np.where(reached, sizes[np.minimum(idx, len(sizes) - 1)], 0) \
+        if len(sizes) else np.zeros(len(thresholds), dtype=np.int64)
+    lx = np.where(reached, idx + 1, 0)
+    return nx.tolist(), lx.tolist(), reached.tolist()
+
+
+def get_contiguity(lengths, genome_size=None, steps=CURVE_STEPS):
+    """Return the contiguity statistics of an assembly, computed from a single
+    cumulative sum over the contig lengths sorted in decreasing order:
+        - 'x', 'Nx' and 'Lx': the Nx/Lx curve, one value per step
+        - 'NGx' and 'LGx': the same against the expected genome size, None
+          when the assembly is too short to reach it, or no genome size
+        - 'auN': the area under the Nx curve, sum(length^2) / total length
+    """
+    sizes = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+    cumul_length = np.cumsum(sizes)
+    total_length = int(cumul_length[-1]) if len(sizes) else 0
+    fractions = np.asarray(steps, dtype=np.float64) / 100
+
+    res = {'x': list(steps)}
+    res['Nx'], res['Lx'], _ = _quantiles(sizes, cumul_length,
+                                         fractions * total_length)
+    if genome_size:
+        ngx, lgx, reached = _quantiles(sizes, cumul_length,
+                                       fractions * genome_size)
+        res['NGx'] = [v if ok else None for v, ok in zip(ngx, reached)]
+        res['LGx'] = [v if ok else None for v, ok in zip(lgx, reached)]
     else:
-        return total_length
+        res['NGx'], res['LGx'] = None, None
 
+    if total_length:
+        value = float(np.dot(sizes, sizes.astype(np.float64))) / total_length
+        res['auN'] = float(f"{value:.2f}")
+    else:
+        res['auN'] = 0.0
+    return res
 
-def get_N50_L50(seq_d):
-    """Return the N50 and the L50"""
-    total_length, contigs_size = get_total_length(seq_d, contig_list=True)
 
-    # Sort the list
-    contigs_size.sort(reverse=True)
+def get_Nx(contiguity, x_values, prefix='N'):
+    """Pick some values of the curve from get_contiguity(), as a dict
+    {'N50': 1234, 'L50': 12}. Use prefix='NG' for the NGx/LGx"""
+    res = dict()
+    for x in x_values:
+        idx = contiguity['x'].index(x)
+        for stat in (prefix, prefix.replace('N', 'L')):
+            curve = contiguity[stat + 'x']
+            res[f"{stat}{x}"] = curve[idx] if curve else None
+    return res
 
-    n50 = 0
-    l50 = 0
-    cumul_length = 0
-    for i in range(0, len(contigs_size)):
-        cumul_length += contigs_size[i]
-        if cumul_length >= (total_length / 2):
-            n50 = contigs_size[i]
-            l50 = i + 1
-            break
 
-    return n50, l50
+def get_N50_L50(lengths):
+    """Return the N50 and the L50"""
+    res = get_Nx(get_contiguity(lengths, steps=(50,)), (50,))
+    return res['N50'], res['L50']
+
+
+def write_curve(fo, name, contiguity, no_header=False):
+    """Write the Nx/Lx (and NGx/LGx) curve of an assembly, one row per x"""
+    stats = ['Nx', 'Lx']
+    if contiguity['NGx'] is not None:
+        stats += ['NGx', 'LGx']
+    if not no_header:
+        print('id', 'x', *stats, sep='\t', file=fo)
+    for i, x in enumerate(contiguity['x']):
+        values = [contiguity[stat][i] for stat in stats]
+        print(name, x, *['NA' if v is None else v for v in values], sep='\t',
+              file=fo)
+    return True
 
 
-def get_GC_content(seq_d):
+def get_GC_content(counters, total_length):
     """ Return the G+C content of the assembly"""
-    num_G_and_C = 0
-    total_length = 0
-
-    for contig, seq in seq_d.items():
-        total_length += len(seq)
-
-        for nt in seq.upper():
-            if nt == "G":
-                num_G_and_C += 1
-            elif nt == "C":
-                num_G_and_C += 1
-    value = (num_G_and_C / total_length) * 100
+    if total_length == 0:
+        return 0.0
+    value = (counters['GC'] / total_length) * 100
     return float(f"{value:.2f}")
 
 
-def get_extreme_contigs(seq_d):
-    """Return the length of the longest and the smallest contigs"""
-    contigs_size = list()
+def get_composition(counters, total_length):
+    """Return the fraction of N, of other ambiguous bases and of soft-masked
+    (lowercase) bases in the assembly"""
+    composition = dict()
+    for key in ('N', 'ambiguous', 'soft_masked'):
+        value = counters[key] / total_length if total_length else 0.0
+        composition[key] = float(f"{value:.4f}")
+    return composition
 
-    for contig, seq in seq_d.items():
-        contigs_size.append(len(seq))
 
-    contigs_size.sort(reverse=True)
-    if len(contigs_size) == 1:
-        return contigs_size[0], contigs_size[0]
-    else:
-        return contigs_size[0], contigs_size[-1]
+def get_extreme_contigs(lengths):
+    """Return the length of the longest and the smallest contigs"""
+    if len(lengths) == 0:
+        return 0, 0
+    return max(lengths), min(lengths)
 
 
 def _append_list(l1, v1, l2, v2):
@@ -116,40 +303,141 @@ def _append_list(l1, v1, l2, v2):
     return l1, l2
 
 
-def print_result(name, total_l=None, n50=None, l50=None, gc=None, longest=None,
-                 n_ctg=None, smallest=None, no_header=False):
-    """Print the result """
+def format_result(name, total_l=None, n50=None, l50=None, gc=None,
+                  longest=None, n_ctg=None, smallest=None, composition=None,
+                  nx=None, aun=None):
+    """Return the headers and the values of the result row"""
     headers, values = ['id'], [name]
 
-    if total_l:
+    if total_l is not None:
         headers, values = _append_list(headers, 'length', values, total_l)
-    if n_ctg:
+    if n_ctg is not None:
         headers, values = _append_list(headers, 'num_contig', values, n_ctg)
-    if n50:
+    if n50 is not None:
         headers, values = _append_list(headers, 'N50', values, n50)
-    if l50:
+    if l50 is not None:
         headers, values = _append_list(headers, 'L50', values, l50)
-    if gc:
+    if gc is not None:
         headers, values = _append_list(headers, 'GC_content', values, gc)
-    if longest:
+    if longest is not None:
         headers, values = _append_list(headers, 'longest_contig', values,
                                        longest)
-    if smallest:
+    if smallest is not None:
         headers, values = _append_list(headers, 'smallest_contig', values,
                                        smallest)
+    if composition is not None:
+        for key, value in composition.items():
+            headers, values = _append_list(headers, key + '_fraction', values,
+                                           value)
+    if nx is not None:
+        for key, value in nx.items():
+            headers, values = _append_list(headers, key, values,
+                                           'NA' if value is None else value)
+    if aun is not None:
+        headers, values = _append_list(headers, 'auN', values, aun)
+
+    return headers, values
+
+
+def get_statistics(asm, options):
+    """Return the statistics of an assembly as the keyword arguments of
+    format_result(), its contiguity curve and the cache status. 'options'
+    holds the flags of the command line, as a dict, to know which
+    statistics are requested"""
+    # Everything comes from a single read of the file, or from the cache.
+    # When only the lengths are needed, the .fai index is enough
+    with gu.Timer('scan') as timer:
+        lengths = None
+        if options['only'] and not (options['gc'] or options['composition']):
+            lengths = lengths_from_fai(asm, build=options['fai'])
+        if lengths is None:
+            lengths, counters, cache_hit = cached_scan(asm, options)
+        else:
+            counters, cache_hit = None, None
+        timer.count(nbytes=0 if asm == '-' else os.path.getsize(asm),
+                    records=len(lengths))
+
+    with gu.Timer('contiguity') as timer:
+        length = get_total_length(lengths)
+        contiguity = get_contiguity(lengths, options['genome_size'])
+        timer.count(records=len(lengths))
+    stats = {'n_ctg': len(lengths)}  # The number of contigs is always there
+    nx = dict()
+
+    # The N50 is reported by default, or with "--only --n50"
+    n50 = options['n50'] or not options['only']
+    if options['only']:
+        if options['length']:
+            stats['total_l'] = length
+        if options['gc']:
+            stats['gc'] = get_GC_content(counters, length)
+        if options['extreme_contigs']:
+            stats['longest'], stats['smallest'] = get_extreme_contigs(lengths)
+        if options['composition']:
+            stats['gc'] = get_GC_content(counters, length)
+            stats['composition'] = get_composition(counters, length)
 
-    if no_header:
-        print("\t".join(values))
     else:
-        print("\t".join(headers), "\n", "\t".join(values), sep='')
-    return True
+        stats['total_l'] = length
+        stats['longest'], stats['smallest'] = get_extreme_contigs(lengths)
+        stats['gc'] = get_GC_content(counters, length)
+        if options['composition']:
+            stats['composition'] = get_composition(counters, length)
+
+    if options['nx']:
+        nx.update(get_Nx(contiguity, NX_COLUMNS))
+    if options['genome_size'] and (n50 or options['nx']):
+        nx.update(get_Nx(contiguity, NX_COLUMNS if options['nx'] else (50,),
+                         prefix='NG'))
+    if n50:
+        n50_l50 = get_Nx(contiguity, (50,))
+        stats['n50'], stats['l50'] = n50_l50['N50'], n50_l50['L50']
+        # Already in their own columns, no need to report them twice
+        nx.pop('N50', None)
+        nx.pop('L50', None)
+    if nx:
+        stats['nx'] = nx
+    if options['aun']:
+        stats['aun'] = contiguity['auN']
+
+    return stats, contiguity, cache_hit
+
+
+def assembly_row(task):
+    """Compute the result row of one assembly, plus its contiguity curve and
+    the cache status. This is the job given to the workers in batch mode, so
+    errors are returned instead of raised, and do not stop the other
+    assemblies"""
+    asm, name, options = task
+    try:
+        stats, contiguity, cache_hit = get_statistics(asm, options)
+        return format_result(name, **stats), contiguity, cache_hit, None
+    except Exception as e:
+        return None, None, None, f"{asm}: {e}"
+
+
+def assembly_name(file_path):
+    """From 'path/to/genome.fna.gz' to 'genome'"""
+    name = gu.strip_compression_ext(os.path.basename(file_path))
+    return os.path.splitext(name)[0]
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
-    parser.add_argument('assembly', help='Genome assembly in fasta[.gz]')
+    parser.add_argument('assembly', help='Genome assembly in fasta, can be '
+                        'compressed (gzip, bgzip,\nbzip2, xz, zstd), "-" for '
+                        'STDIN. Several files,\ndirectories or glob patterns '
+                        '(quoted) can be given',
+                        nargs='*')
+    parser.add_argument('--fofn', help='A file with the path of one assembly '
+                        'per line', metavar="")
     parser.add_argument('--name', help='A name to recognize the assembly '
-                        '- ["assembly"]', default="assembly", metavar="")
+                        '- ["assembly"]\nWith several assemblies, the file '
+                        'names are used', default="assembly", metavar="")
+    parser.add_argument('-t', '--threads', help='Number of assemblies '
+                        'processed in parallel - [1]\nWith a single bgzip '
+                        'assembly, used to decompress it', default=1,
+                        type=int, metavar="")
     parser.add_argument('--no_header', help='Do not print the headers',
                         default=False, action='store_true')
     parser.add_argument('--only', help='Turn ON the choice of statistic to '
@@ -165,6 +453,40 @@ if __name__ == "__main__":
     parser.add_argument('--extreme_contigs', help='Return the size of the '
                         'longest and smallest contigs', default=False,
                         action='store_true')
+    parser.add_argument('--composition', help='Add the fraction of N, of '
+                        'other ambiguous bases and\nof soft-masked '
+                        '(lowercase) bases, with the G+C content',
+                        default=False, action='store_true')
+    parser.add_argument('--nx', help='Add the N10 to N90 and the L10 to L90',
+                        default=False, action='store_true')
+    parser.add_argument('--aun', help='Add the auN, the area under the Nx '
+                        'curve', default=False, action='store_true')
+    parser.add_argument('--genome_size', help='Expected genome size, in bp, '
+                        'to add the NGx and LGx\nalong with the Nx and Lx',
+                        type=int, metavar="")
+    parser.add_argument('--curve', help='File to write the full Nx/Lx curve '
+                        '(x from 1 to 100),\nand NGx/LGx with --genome_size',
+                        metavar="")
+    parser.add_argument('--cache', help='SQLite file caching the statistics '
+                        'between runs - \n["' +
+                        gu.default_cache_path('assembly_statistics.sqlite') +
+                        '"]', default=gu.default_cache_path(
+                            'assembly_statistics.sqlite'), metavar="")
+    parser.add_argument('--no_cache', '--no-cache', help='Do not use the '
+                        'cache', default=False, action='store_true')
+    parser.add_argument('--refresh', help='Compute the statistics again and '
+                        'update the cache', default=False, action='store_true')
+    parser.add_argument('--cache_hash', help='Also check the content of the '
+                        'files to validate the\ncache (slower)',
+                        default=False, action='store_true')
+    parser.add_argument('--cache_size', help='Maximum size of the cache, in '
+                        'MB - [512]', default=512, type=int, metavar="")
+    parser.add_argument('--fai', help='Build the samtools index (.fai) if it '
+                        'is missing or\noutdated. An up to date index is '
+                        'always used for\nstatistics on lengths only '
+                        '(--only without --gc\nor --composition)',
+                        default=False, action='store_true')
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -173,34 +495,59 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        if not os.path.isfile(args.assembly):
-            raise Exception("There is no file %s" % args.assembly)
-
-        # Init variables
-        contigs = fasta_to_seq_dict(args.assembly)
-        n_ctg = len(contigs.keys())  # Get the number of contigs
-        total_l, n50, l50 = None, None, None
-        gc_cont, longest, smallest = None, None, None
-
-        # Get values
-        if args.only:
-            if args.n50:
-                n50, l50 = get_N50_L50(contigs)
-            if args.gc:
-                gc_cont = get_GC_content(contigs)
-            if args.extreme_contigs:
-                longest, smallest = get_extreme_contigs(contigs)
-
-        else:
-            total_l = get_total_length(contigs)
-            n50, l50 = get_N50_L50(contigs)
-            longest, smallest = get_extreme_contigs(contigs)
-            gc_cont = get_GC_content(contigs)
-
-        # Print
-        print_result(args.name, total_l=total_l, n50=n50, l50=l50, gc=gc_cont,
-                     n_ctg=n_ctg, longest=longest, smallest=smallest,
-                     no_header=args.no_header)
+        with gu.Profiler(args.profile, args.cprofile):
+            with gu.Timer('list'):
+                assemblies = gu.list_input_files(args.assembly, ASSEMBLY_EXT,
+                                                 args.fofn, 'assembly')
+                if len(assemblies) == 1 and assemblies == args.assembly:
+                    names = [args.name]
+                else:
+                    names = [assembly_name(asm) for asm in assemblies]
+
+            options = {key: getattr(args, key) for key in (
+                'only', 'length', 'n50', 'gc', 'extreme_contigs',
+                'composition', 'nx', 'aun', 'genome_size', 'refresh',
+                'cache_hash', 'fai')}
+            options['cache'] = None if args.no_cache else args.cache
+            options['cache_size'] = args.cache_size * 1024 ** 2
+            options['io_threads'] = args.threads if len(assemblies) == 1 \
+                else 1
+            tasks = [(asm, name, options)
+                     for asm, name in zip(assemblies, names)]
+            rows = gu.ordered_map(assembly_row, tasks, args.threads)
+
+            curve = open(args.curve, 'w') if args.curve else None
+            header_done = args.no_header
+            failed = 0
+            cache_status = {True: 0, False: 0, None: 0}  # hit, miss, none
+            with gu.Timer('statistics') as timer:
+                for asm, (row, contiguity, cache_hit, error) in zip(
+                        assemblies, rows):
+                    timer.count(nbytes=0 if asm == '-' else
+                                os.path.getsize(asm), records=1)
+                    if error:
+                        print(error, file=sys.stderr)
+                        failed += 1
+                        continue
+                    cache_status[cache_hit] += 1
+                    headers, values = row
+                    with gu.Timer('write'):
+                        if curve:
+                            write_curve(curve, values[0], contiguity,
+                                        no_header=header_done)
+                        if not header_done:
+                            print("\t".join(headers))
+                            header_done = True
+                        print("\t".join(values))
+
+            if curve:
+                curve.close()
+            if options['cache']:
+                print(f"Cache: {cache_status[True]} hit(s), "
+                      f"{cache_status[False]} miss(es)", file=sys.stderr)
+
+            if failed:
+                raise Exception(f"{failed}/{len(tasks)} assemblies failed")
 
     except Exception as e:
         # Something went wrong with the arguments?!
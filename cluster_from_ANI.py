@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Cluster genomes from their pairwise ANI (or AAI): the pairs above a
+threshold, e.g. 95% ANI for species, are the edges of a sparse graph, whose
+connected components (single linkage) or greedy centroid clusters are the
+clusters. The input is a pairwise table (see comparem_aai_result_to_matrix.py
+for the formats) or a .npy matrix, read by chunks, so only the pairs above
+the threshold are kept in memory"""
+
+import os
+import sys
+import argparse
+from argparse import RawTextHelpFormatter
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import generic_utils as gu
+import comparem_aai_result_to_matrix as cm
+
+
+CELLS_PER_BLOCK = 16 * 1024 * 1024  # Cells of a .npy matrix read at once
+
+
+def table_edges(table, table_format, threshold):
+    """Read a pairwise table by chunks. Return the sorted names of the
+    genomes, and a generator of the codes of the two genomes and the value
+    of the pairs above the threshold, plus the highest value, for each
+    chunk"""
+    reader = cm.FORMATS[table_format][0]
+    labels = cm.read_labels(table, reader)
+    index = pd.Index(labels)
+
+    def _edges():
+        for genomes_a, genomes_b, values in reader(table):
+            codes_a, codes_b = cm.pair_codes(table, genomes_a, genomes_b,
+                                             index)
+            keep = values >= threshold
+            yield (codes_a[keep], codes_b[keep], values[keep],
+                   np.nanmax(values, initial=0))
+    return labels, _edges()
+
+
+def matrix_edges(matrix_file, threshold):
+    """Same as table_edges() for a .npy matrix, memory-mapped and read by
+    blocks of rows"""
+    labels, matrix = gu.load_matrix(matrix_file)
+
+    def _edges():
+        step = max(1, CELLS_PER_BLOCK // max(1, len(labels)))
+        for start in range(0, len(labels), step):
+            block = np.asarray(matrix[start:start + step])
+            rows, cols = np.nonzero(block >= threshold)
+            yield (rows + start, cols, block[rows, cols],
+                   np.nanmax(block, initial=0))
+    return labels, _edges()
+
+
+def similarity_graph(num_genomes, edges):
+    """Build the sparse, symmetric graph of the pairs above the threshold,
+    without the genomes against themselves. A pair found both ways, or
+    several times, keeps its highest value. Return the graph and the
+    highest value of the table, above the threshold or not"""
+    parts, max_value = ([], [], []), 0
+    for *chunk, chunk_max in edges:
+        for part, array in zip(parts, chunk):
+            part.append(array)
+        max_value = max(max_value, float(chunk_max))
+    codes_a, codes_b, values = (np.concatenate(part) if part else
+                                np.array([], dtype=dtype) for part, dtype in
+                                zip(parts, (np.intp, np.intp, np.float32)))
+    keep = codes_a != codes_b
+    codes_a, codes_b, values = codes_a[keep], codes_b[keep], values[keep]
+
+    # Highest value of each (a, b) first, then drop the duplicates
+    order = np.lexsort((-values, codes_b, codes_a))
+    codes_a, codes_b, values = codes_a[order], codes_b[order], values[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (codes_a[1:] != codes_a[:-1]) | (codes_b[1:] != codes_b[:-1])
+
+    graph = coo_matrix((values[first], (codes_a[first], codes_b[first])),
+                       shape=(num_genomes, num_genomes)).tocsr()
+    return graph.maximum(graph.T).tocsr(), max_value
+
+
+def component_clusters(graph):
+    """Single linkage: the clusters are the connected components of the
+    graph. The representative of a cluster is its genome with the highest
+    sum of values to its neighbours, i.e. the most central one. Return the
+    representative of each genome"""
+    _, components = connected_components(graph, directed=False)
+    score = np.asarray(graph.sum(axis=1)).ravel()
+    order = np.lexsort((-score, components))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = components[order][1:] != components[order][:-1]
+    representatives = np.empty(len(components), dtype=np.intp)
+    representatives[components[order][first]] = order[first]
+    return representatives[components]
+
+
+def greedy_clusters(graph):
+    """Greedy centroid clustering: the genomes are taken by decreasing number
+    of neighbours, and each genome not clustered yet becomes the centroid,
+    and representative, of a cluster with its neighbours not clustered yet.
+    Unlike single linkage, every genome is above the threshold with its
+    centroid. Return the representative of each genome"""
+    degree = np.diff(graph.indptr)
+    representatives = np.full(graph.shape[0], -1, dtype=np.intp)
+    for genome in np.argsort(-degree, kind='stable').tolist():
+        if representatives[genome] >= 0:
+            continue
+        representatives[genome] = genome
+        neighbours = graph.indices[graph.indptr[genome]:
+                                   graph.indptr[genome + 1]]
+        neighbours = neighbours[representatives[neighbours] < 0]
+        representatives[neighbours] = genome
+    return representatives
+
+
+def number_clusters(representatives):
+    """Number the clusters from 1, by decreasing size, then by
+    representative. Return the cluster of each genome and the
+    representative and size of each cluster"""
+    reps, inverse, sizes = np.unique(representatives, return_inverse=True,
+                                     return_counts=True)
+    order = np.lexsort((reps, -sizes))
+    numbers = np.empty(len(reps), dtype=np.intp)
+    numbers[order] = np.arange(1, len(reps) + 1)
+    return numbers[inverse], reps[order], sizes[order]
+
+
+def write_clusters(labels, clusters, representatives, outfile):
+    """Write the cluster and the representative of each genome, by cluster"""
+    fo = open(outfile, 'w', encoding='utf-8') if outfile else sys.stdout
+    print("genome", "cluster", "representative", sep='\t', file=fo)
+    for i in np.lexsort((np.arange(len(labels)), clusters)).tolist():
+        print(labels[i], clusters[i], labels[representatives[i]], sep='\t',
+              file=fo)
+    if outfile:
+        fo.close()
+    return True
+
+
+def write_representatives(labels, reps, sizes, outfile):
+    """Write the representative and the size of each cluster"""
+    with open(outfile, 'w', encoding='utf-8') as fo:
+        print("cluster", "representative", "size", sep='\t', file=fo)
+        for number, (rep, size) in enumerate(zip(reps.tolist(),
+                                                 sizes.tolist()), 1):
+            print(number, labels[rep], size, sep='\t', file=fo)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter,
+                                     description=__doc__)
+    parser.add_argument('table', help='Pairwise result table, can be '
+                        'compressed, or a .npy\nmatrix with its .labels.txt '
+                        'file')
+    parser.add_argument('-f', '--format', help='Format of the table - '
+                        '[comparem]. A square\nmatrix in TSV is read with '
+                        '"pyani"', choices=sorted(cm.FORMATS),
+                        default='comparem')
+    parser.add_argument('-t', '--threshold', help='Minimum value of a pair '
+                        'to cluster it - [95]\nA pair is above it if any of '
+                        'its values is', default=95, type=float, metavar="")
+    parser.add_argument('-m', '--method', help='Single linkage (connected '
+                        'components) or greedy\ncentroid clustering - '
+                        '[components]', choices=['components', 'greedy'],
+                        default='components')
+    parser.add_argument('-o', help='File to write the cluster of each genome. '
+                        'Default is\nSTDOUT', metavar="")
+    parser.add_argument('--representatives', help='File to write the '
+                        'representative and the size\nof each cluster',
+                        metavar="")
+    gu.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    if len(sys.argv) == 1:  # In the case where nothing is provided
+        parser.print_usage(file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        with gu.Profiler(args.profile, args.cprofile):
+            if not os.path.isfile(args.table):
+                raise Exception("There is no file %s" % args.table)
+
+            # Only the pairs above the threshold are kept
+            with gu.Timer('read') as timer:
+                if args.table.endswith('.npy'):
+                    labels, edges = matrix_edges(args.table, args.threshold)
+                else:
+                    labels, edges = table_edges(args.table, args.format,
+                                                args.threshold)
+                graph, max_value = similarity_graph(len(labels), edges)
+                if max_value <= 1 < args.threshold:
+                    raise Exception("The values are fractions, not %: the "
+                                    "threshold must be a fraction too, e.g. "
+                                    f"{args.threshold / 100:g}")
+                timer.count(nbytes=os.path.getsize(args.table),
+                            records=graph.nnz // 2)
+
+            with gu.Timer('cluster') as timer:
+                if args.method == 'greedy':
+                    representatives = greedy_clusters(graph)
+                else:
+                    representatives = component_clusters(graph)
+                clusters, reps, sizes = number_clusters(representatives)
+                timer.count(records=len(labels))
+
+            with gu.Timer('write'):
+                write_clusters(labels, clusters, representatives, args.o)
+                if args.representatives:
+                    write_representatives(labels, reps, sizes,
+                                          args.representatives)
+
+            print(f"{len(labels)} genomes, {len(reps)} clusters at "
+                  f"{args.threshold:g} ({args.method})", file=sys.stderr)
+
+    except Exception as e:
+        # Something went wrong with the arguments?!
+        print(e)
+        sys.exit(1)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-"""Reformat a result table from 'CompareM aai_wf'"""
+"""Reformat a pairwise similarity table (CompareM aai_wf, pyANI, fastANI,
+skani) into a symmetric matrix"""
 
 import os
 import sys
@@ -9,20 +10,183 @@ from argparse import RawTextHelpFormatter
 import numpy as np
 import pandas as pd
 
-
-def diff_list(lst1, lst2):
-    """Find the item from list 1 NOT present in list 2"""
-    for elt in lst1:
-        if elt not in lst2:
-            return elt
+import generic_utils as gu
+
+
+CHUNK_SIZE = 1000000  # Rows (or values of a matrix) of the table read at once
+CELLS_PER_BLOCK = 16 * 1024 * 1024  # Cells of the matrix reconciled at once
+
+
+def read_columns(table, columns, values=True, header='infer',
+                 chunksize=CHUNK_SIZE):
+    """Read a table of one pair of genomes per row, by chunks of rows, with
+    only the columns of the two genomes, as categories, and the one of the
+    values, as float32 ('values' False to skip it). Yield the genomes
+    (pandas Categorical) and the values of each chunk"""
+    genome_a, genome_b, value = columns
+    usecols = [genome_a, genome_b] + ([value] if values else [])
+    with gu.open_file(table) as fi:
+        for chunk in pd.read_table(fi, header=header, usecols=usecols,
+                                   chunksize=chunksize,
+                                   dtype={genome_a: 'category',
+                                          genome_b: 'category',
+                                          value: np.float32}):
+            yield (chunk[genome_a].array, chunk[genome_b].array,
+                   chunk[value].to_numpy() if values else None)
+
+
+def read_comparem(table, values=True):
+    """CompareM aai_wf table: '#Genome A', 'Genome B' and 'Mean AAI'"""
+    return read_columns(table, ('#Genome A', 'Genome B', 'Mean AAI'), values)
+
+
+def read_fastani(table, values=True):
+    """fastANI output, without header: query, reference and ANI. The genomes
+    are the paths of their files"""
+    return read_columns(table, (0, 1, 2), values, header=None)
+
+
+def read_skani(table, values=True):
+    """skani dist/triangle -E table: 'Ref_file', 'Query_file' and 'ANI'"""
+    return read_columns(table, ('Ref_file', 'Query_file', 'ANI'), values)
+
+
+def read_pyani(table, values=True):
+    """pyANI square matrix (e.g. ANIm_percentage_identity.tab), the genomes
+    of the rows against the ones of the columns, read by chunks of rows.
+    pyANI writes fractions, which are turned into %, like the other formats.
+    A matrix already in % (e.g. written by this script) is kept as it is"""
+    with gu.open_file(table) as fi:
+        columns = pd.Index(fi.readline().rstrip('\r\n').split('\t')[1:])
+        ncols = len(columns)
+        dtype = {i: np.float32 for i in range(1, ncols + 1)}
+        dtype[0] = str  # The names, even if they look like numbers
+        scale = None
+        for chunk in pd.read_table(fi, header=None, index_col=0, dtype=dtype,
+                                   chunksize=max(1, CHUNK_SIZE // ncols)):
+            nrows = len(chunk)
+            matrix = None
+            if values:
+                matrix = chunk.to_numpy(np.float32).ravel()
+                if scale is None:
+                    scale = 100 if np.nanmax(matrix, initial=0) <= 1 else 1
+                matrix *= scale
+            yield (pd.Categorical.from_codes(
+                       np.repeat(np.arange(nrows), ncols),
+                       categories=chunk.index),
+                   pd.Categorical.from_codes(
+                       np.tile(np.arange(ncols), nrows), categories=columns),
+                   matrix)
+
+
+# Format: reader of the pairs, value of a genome against itself
+FORMATS = {'comparem': (read_comparem, 100),
+           'pyani': (read_pyani, 100),
+           'fastani': (read_fastani, 100),
+           'skani': (read_skani, 100)}
+
+
+def read_labels(table, reader):
+    """First pass over the table: the sorted names of all the genomes"""
+    labels = set()
+    for genomes_a, genomes_b, _ in reader(table, values=False):
+        labels.update(genomes_a.categories)
+        labels.update(genomes_b.categories)
+    return sorted(labels)
+
+
+def chunk_codes(genomes, index):
+    """Codes in 'index' of a Categorical of genomes: only its categories are
+    looked up"""
+    return index.get_indexer(genomes.categories)[genomes.codes]
+
+
+def pair_codes(table, genomes_a, genomes_b, index):
+    """Codes in 'index' of the two genomes of each pair of a chunk. A missing
+    or empty name (code -1) would be taken as the last genome of the chunk,
+    so it is an error"""
+    missing = np.count_nonzero((genomes_a.codes < 0) | (genomes_b.codes < 0))
+    if missing:
+        raise Exception(f"{table}: {missing} row(s) without the name of a "
+                        "genome")
+    return chunk_codes(genomes_a, index), chunk_codes(genomes_b, index)
+
+
+def symmetrize(matrix, reconcile='mean'):
+    """Make the matrix symmetric in place, by blocks of rows: each pair gets
+    the mean, max or min ('reconcile') of its two values, A vs B and B vs
+    A, or the only one present. The pairs absent both ways (NaN) are 0"""
+    step = max(1, CELLS_PER_BLOCK // len(matrix))
+    for start in range(0, len(matrix), step):
+        rows = slice(start, start + step)
+        forward, backward = matrix[rows], matrix[:, rows].T
+        # fmax() and fmin() ignore the NaN, so a single value is kept
+        if reconcile == 'max':
+            values = np.fmax(forward, backward)
+        elif reconcile == 'min':
+            values = np.fmin(forward, backward)
+        else:
+            values = (np.fmax(forward, backward) +
+                      np.fmin(forward, backward)) / 2
+        np.nan_to_num(values, copy=False)
+        matrix[rows] = values
+        matrix[:, rows] = values.T
+    return matrix
+
+
+def build_matrix(table, table_format='comparem', reconcile='mean'):
+    """Build the symmetric float32 matrix of the values of each pair of
+    genomes, in two passes over the table: the names of the genomes first,
+    then the values of each chunk of rows are scattered directly into the
+    matrix. The memory used is about the one of the matrix, whatever the
+    size of the table, and any number of genomes can be missing from either
+    column. The two values of a pair are reconciled by symmetrize(), and
+    the pairs absent from the table are 0.
+    Return the names, in the sorted order, the matrix and the number of
+    pairs"""
+    reader, diagonal = FORMATS[table_format]
+    labels = read_labels(table, reader)
+    index = pd.Index(labels)
+
+    matrix = np.full((len(labels), len(labels)), np.nan, dtype=np.float32)
+    num_pairs = 0
+    for genomes_a, genomes_b, values in reader(table):
+        matrix[pair_codes(table, genomes_a, genomes_b, index)] = values
+        num_pairs += len(values)
+    symmetrize(matrix, reconcile)
+    np.fill_diagonal(matrix, diagonal)
+    return labels, matrix, num_pairs
+
+
+def write_matrix(labels, matrix, outfile):
+    """Write the matrix as a TSV table, with the names as header and first
+    column. The float32 values are written with their 7 significant
+    digits"""
+    row_format = '%s' + '\t%.7g' * len(labels) + '\n'
+    with open(outfile, 'w', encoding='utf-8') as fo:
+        fo.write('\t' + '\t'.join(labels) + '\n')
+        for label, row in zip(labels, matrix):
+            fo.write(row_format % (label, *row.tolist()))
+    return True
 
 
 if __name__ == "__main__":
-    __description__ = "Reformat a result table from 'CompareM aai_wf', " \
-                      "output in the same directory as input"
+    __description__ = __doc__ + ", output in the same directory as input"
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter,
                                      description=__description__)
-    parser.add_argument('table', help='Comparem aai_wf result table')
+    parser.add_argument('table', help='Pairwise result table, can be '
+                        'compressed')
+    parser.add_argument('-f', '--format', help='Format of the table - '
+                        '[comparem]', choices=sorted(FORMATS),
+                        default='comparem')
+    parser.add_argument('--reconcile', help='Value of a pair found both ways '
+                        '(A vs B and B vs A)\n- [mean]',
+                        choices=['mean', 'max', 'min'], default='mean')
+    parser.add_argument('--npy', help='Write the matrix as a binary float32 '
+                        '.npy file, with the\nnames in a .labels.txt file, '
+                        'instead of a TSV table.\nIt can be loaded '
+                        'memory-mapped', default=False, action='store_true')
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -31,51 +195,28 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        if not os.path.isfile(args.table):
-            raise Exception("There is no file %s" % args.table)
-
-        # Read the file
-        aai_tab = pd.read_table(args.table)
-        # Reshape the matrix
-        df = aai_tab.pivot(index='#Genome A', columns='Genome B',
-                           values='Mean AAI').fillna(0).copy()
-
-        # Then, I have to find the genome not present in rows, and same for
-        # the one absent from columns
-        common_genomes = np.intersect1d(aai_tab['#Genome A'].unique().tolist(),
-                                        aai_tab['Genome B'].unique().tolist(),
-                                        assume_unique=True).tolist()
-
-        # To find the genome not present in rows, I have to identify the genome
-        # present from "Genome B" but absent from the intersection of both datasets
-        not_in_col = diff_list(aai_tab['#Genome A'].unique().tolist(),
-                               common_genomes)
-        not_in_row = diff_list(aai_tab['Genome B'].unique().tolist(),
-                               common_genomes)
-
-        # Add the column
-        df[not_in_col] = np.zeros(len(df.index))
-
-        # Add the row: I have to concatenate two dataframes
-        temp = pd.DataFrame(dict(zip(df.columns , np.zeros(len(df.columns)))),
-                            index=[not_in_row])
-        df = pd.concat([df, temp], axis=0)
-        del(temp)
-
-        # Sorting the columns based on the index
-        df = df.reindex(columns=df.index)
-
-        # At this point, we have a semi-matrix, let's make it complete and
-        # symetric to replace the zeros in the diagonal by 100
-        aai = df + df.T
-        aai.replace({0:100}, inplace=True)
-
-        # Save
-        outpath = os.path.dirname(args.table)
-        outname = '.'.join(os.path.basename(args.table).split('.')[:-1]) + \
-                    '.reformat.tsv'
-
-        aai.to_csv(outpath + '/' + outname, sep='\t')
+        with gu.Profiler(args.profile, args.cprofile):
+            if not os.path.isfile(args.table):
+                raise Exception("There is no file %s" % args.table)
+
+            # Read the file, by chunks
+            with gu.Timer('read') as timer:
+                labels, aai, num_pairs = build_matrix(
+                    args.table, args.format, args.reconcile)
+                timer.count(nbytes=os.path.getsize(args.table),
+                            records=num_pairs)
+
+            # Save
+            outname = '.'.join(os.path.basename(args.table).split('.')[:-1]) + \
+                ('.reformat.npy' if args.npy else '.reformat.tsv')
+            outfile = os.path.join(os.path.dirname(args.table), outname)
+
+            with gu.Timer('write') as timer:
+                if args.npy:
+                    gu.save_matrix(outfile, labels, aai)
+                else:
+                    write_matrix(labels, aai, outfile)
+                timer.count(nbytes=os.path.getsize(outfile))
 
     except Exception as e:
         # Something went wrong with the arguments?!
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+""" This script removes (default) or extracts sequences from a Fasta/Fastq
+file, from a list of identifiers. The identifier of a sequence is the first
+word of its defline, and it must be exactly the same as in the list.
+The sequences are read one by one, so the file can be of any size, and the
+sequences removed and the identifiers not found are reported to STDERR
+"""
+
+import os
+import sys
+import argparse
+from argparse import RawTextHelpFormatter
+import generic_utils as gu
+
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024  # Bytes
+
+
+def read_ids(file_path):
+    """Read the list of identifiers, one per line. Only the first word is
+    kept, without a leading '>' or '@', so a list of deflines works too"""
+    ids = set()
+    with gu.open_file(file_path, 'rb') as fi:
+        for line in fi:
+            fields = line.split(None, 1)
+            if fields:
+                ids.add(fields[0].lstrip(b'>@'))
+
+    if len(ids) == 0:
+        raise Exception("The list of identifiers is empty. Exit")
+    return ids
+
+
+def filter_fasta(records, ids, keep, fo):
+    """Write the Fasta records to keep. Return the number of records removed,
+    their identifiers (only when removing the listed ones, otherwise there
+    can be millions of them) and the identifiers found"""
+    num_removed, removed, found = 0, [], set()
+    for header, seq in records:
+        seq_id = header.split(None, 1)[0] if header else b''
+        listed = seq_id in ids
+        if listed:
+            found.add(seq_id)
+        if listed == keep:
+            fo.write(b'>' + header + b'\n')
+            if seq:
+                fo.write(seq + b'\n')
+        else:
+            num_removed += 1
+            if not keep:
+                removed.append(seq_id)
+    return num_removed, removed, found
+
+
+def filter_fastq(records, ids, keep, fo):
+    """Same as filter_fasta() for Fastq records"""
+    num_removed, removed, found = 0, [], set()
+    for header, seq, qual in records:
+        seq_id = header.split(None, 1)[0] if header else b''
+        listed = seq_id in ids
+        if listed:
+            found.add(seq_id)
+        if listed == keep:
+            fo.write(b'@' + header + b'\n' + seq + b'\n+\n' + qual + b'\n')
+        else:
+            num_removed += 1
+            if not keep:
+                removed.append(seq_id)
+    return num_removed, removed, found
+
+
+def indexed_records(file_path, ids, build=False):
+    """Return the Fasta records of the identifiers, read directly from the
+    file through its .fai index, in the order of the file, and the number of
+    sequences in the file. Return None if the index cannot be used"""
+    if not (build or gu.is_fai_fresh(file_path)):
+        return None
+    try:
+        index = gu.FastaIndex(file_path)
+    except Exception:
+        return None  # Compressed file, irregular lines...
+
+    names = sorted((n for n in (i.decode() for i in ids) if n in index),
+                   key=lambda n: index.index[n][1])
+
+    def _records():
+        with index:
+            for name in names:
+                yield index.record(name)
+    return _records(), len(index)
+
+
+def write_report(log, num_removed, removed, missing, num_ids):
+    """Print what was removed and the identifiers absent from the file.
+    With --keep, only the number of sequences removed is known"""
+    print(f"{num_removed} sequence(s) removed" + (":" if removed else ""),
+          file=log)
+    for seq_id in removed:
+        print(seq_id.decode(), file=log)
+
+    print(f"{len(missing)}/{num_ids} identifier(s) not found in the file"
+          + (":" if missing else ""), file=log)
+    for seq_id in sorted(missing):
+        print(seq_id.decode(), file=log)
+    return True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter,
+                                     description=__doc__)
+    parser.add_argument('sequences', help='Fasta or Fastq file, can be '
+                        'compressed. "-" for STDIN')
+    parser.add_argument('-i', '--ids', help='File with one identifier per '
+                        'line', metavar="", required=True)
+    parser.add_argument('--keep', help='Extract the sequences of the list '
+                        'instead of removing them', default=False,
+                        action='store_true')
+    parser.add_argument('-o', help='File to write the sequences. Default is '
+                        'STDOUT', metavar="")
+    parser.add_argument('--log', help='File to write the report. Default is '
+                        'STDERR', metavar="")
+    parser.add_argument('--format', help='Format of the sequences, guessed '
+                        'from the file if not given', choices=['fasta',
+                                                               'fastq'])
+    parser.add_argument('--fai', help='With --keep, build the .fai index of '
+                        'the Fasta file if needed\nto read only the sequences '
+                        'to extract. An up to date index\nis always used',
+                        default=False, action='store_true')
+    parser.add_argument('--index_max', help='Maximum number of identifiers '
+                        'to use the index - [10000]', default=10000, type=int,
+                        metavar="")
+    gu.add_profile_arguments(parser)
+
+    args = parser.parse_args()
+
+    if len(sys.argv) == 1:  # In the case where nothing is provided
+        parser.print_usage(file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        with gu.Profiler(args.profile, args.cprofile):
+            if args.sequences != '-':
+                gu.is_file_exists(args.sequences)
+            with gu.Timer('read_ids') as timer:
+                ids = read_ids(args.ids)
+                timer.count(records=len(ids))
+            seq_format = args.format or gu.seq_file_format(args.sequences)
+            if seq_format is None:
+                if args.sequences == '-':
+                    # Parsing FASTQ as FASTA would silently write nothing
+                    raise Exception("The format of STDIN cannot be guessed, "
+                                    "see --format")
+                seq_format = 'fasta'
+
+            if args.o:
+                fo = open(args.o, 'wb', buffering=WRITE_BUFFER_SIZE)
+            else:
+                fo = sys.stdout.buffer
+            log = open(args.log, 'w') if args.log else sys.stderr
+
+            with gu.Timer('filter') as timer:
+                # A few sequences to extract from a big file: jump to them
+                # directly
+                records = None
+                if args.keep and seq_format == 'fasta' and \
+                        args.sequences != '-' and len(ids) <= args.index_max:
+                    records = indexed_records(args.sequences, ids,
+                                              build=args.fai)
+
+                if records is not None:
+                    records, num_seqs = records
+                    _, removed, found = filter_fasta(records, ids, True, fo)
+                    # The other sequences were not even read
+                    num_removed = num_seqs - len(found)
+                    print("Sequences read through the .fai index", file=log)
+                elif seq_format == 'fastq':
+                    num_removed, removed, found = filter_fastq(
+                        gu.iter_fastq(args.sequences), ids, args.keep, fo)
+                else:
+                    records = gu.iter_fasta(args.sequences,
+                                            strip_newlines=False)
+                    num_removed, removed, found = filter_fasta(
+                        records, ids, args.keep, fo)
+
+                if args.o:
+                    fo.close()
+                else:
+                    fo.flush()
+                if args.sequences != '-':
+                    timer.count(nbytes=os.path.getsize(args.sequences))
+
+            write_report(log, num_removed, removed, ids - found, len(ids))
+            if args.log:
+                log.close()
+
+    except Exception as e:
+        # Something went wrong with the arguments?!
+        print(e)
+        sys.exit(1)
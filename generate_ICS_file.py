@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 import sys
 import argparse
 import icalendar as ic
+import generic_utils as gu
 
 UID = 0
 
@@ -54,7 +55,7 @@ def parse_dates(infile):
     """
     all_dates = []
     # loop over the lines of line (dates)
-    with open(infile, "r", encoding="utf-8") as fi:
+    with gu.open_file(infile, encoding="utf-8") as fi:
         for line in fi.readlines():
             start = datetime.strptime(line.rstrip() + "-8", "%Y-%m-%d-%H")  # Force the 8 am
             end = datetime.strptime(line.rstrip() + "-12", "%Y-%m-%d-%H")  # Force noon
@@ -108,6 +109,7 @@ if __name__ == "__main__":
     parser.add_argument('dates', help='File with the dates, format "YYYY-MM-DD"')
     parser.add_argument('ouftile', help='Basename of the file that contains the'
                         ' calendar')
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -116,25 +118,31 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        ## Add checks if input and output file exists ==> raise error
-
-        # init the calendar
-        cal = ic.Calendar()
-
-        # Add mandatory fields to be compliant with the RFC 5545 3.6
-        cal.add('prodid', 'DIAMOND ANR calendar')
-        cal.add('version', '2.0')
-
-        # Read the dates
-        dates = parse_dates(args.dates)
-
-        # Create the events 
-        ## Create an event 48h before to charge the batteries
-        ## and book the material
-        cal = create_events(cal, dates)
-
-        # write the ICS file
-        print_cal(cal, args.ouftile + ".ics")
+        with gu.Profiler(args.profile, args.cprofile):
+            ## Add checks if input and output file exists ==> raise error
+
+            # init the calendar
+            cal = ic.Calendar()
+
+            # Add mandatory fields to be compliant with the RFC 5545 3.6
+            cal.add('prodid', 'DIAMOND ANR calendar')
+            cal.add('version', '2.0')
+
+            # Read the dates
+            with gu.Timer('read') as timer:
+                dates = parse_dates(args.dates)
+                timer.count(records=len(dates))
+
+            # Create the events
+            ## Create an event 48h before to charge the batteries
+            ## and book the material
+            with gu.Timer('events') as timer:
+                cal = create_events(cal, dates)
+                timer.count(records=len(dates))
+
+            # write the ICS file
+            with gu.Timer('write'):
+                print_cal(cal, args.ouftile + ".ics")
 
     except Exception as e:
         # Something went wrong with the arguments?!
@@ -1,11 +1,43 @@
 # -*- coding: utf-8
 
+import io
 import os
+import bz2
 import sys
+import zlib
+import gzip
+import lzma
+import json
 import math
+import mmap
+import glob
+import shlex
+import stat
 import time
 import shutil
+import struct
+import sqlite3
+import cProfile
+import hashlib
+import resource
+import threading
+import contextlib
 import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np  # Optional, makes some functions much faster
+except ImportError:
+    np = None
+
+COMPRESSED_EXT = ('.gz', '.bgz', '.bz2', '.xz', '.zst')
+IO_BUFFER_SIZE = 1024 * 1024  # Bytes
+WRITE_BATCH_SIZE = 8 * IO_BUFFER_SIZE  # Bytes written at once
+SEQ_WHITESPACE = b'\n\r\t\v\f '  # Removed from the sequences
+JOB_FIELDS = ('name', 'status', 'exit_code', 'wall_time', 'user_time',
+              'sys_time', 'max_rss_mb', 'rss_floor_mb', 'command', 'error')
 
 
 def create_dir(file_path):
@@ -49,17 +81,52 @@ def remove_file(file_path):
     return True
 
 
+def strip_compression_ext(file_path):
+    """From 'genome.fa.gz' to 'genome.fa'"""
+    for ext in COMPRESSED_EXT:
+        if file_path.lower().endswith(ext):
+            return file_path[:-len(ext)]
+    return file_path
+
+
 def check_seq_file_extension(file_path):
     _ext_ok = ('.fa', '.fasta', '.fq', '.fastq', '.pep')
-    if file_path.lower().endswith('.gz'):
-        if file_path.lower()[:-3].endswith(_ext_ok):
-            return True
-    elif file_path.lower().endswith(_ext_ok):
+    if strip_compression_ext(file_path).lower().endswith(_ext_ok):
         return True
     else:
         return False
 
 
+def list_input_files(paths, extensions, fofn=None, kind='file'):
+    """Return the list of files to process, in the order given by the user.
+    A path can be a file, a directory, where the files ending with one of
+    'extensions' (compressed or not) are taken in alphabetical order, or a
+    glob pattern (quoted, so the shell does not expand it). 'fofn' is a file
+    with one path per line. 'kind' names the files in the errors"""
+    if fofn:
+        with open_file(fofn) as fi:
+            paths = paths + [line.strip() for line in fi if line.strip()]
+
+    files = list()
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                file_path = os.path.join(path, file_name)
+                if os.path.isfile(file_path) and strip_compression_ext(
+                        file_path).lower().endswith(extensions):
+                    files.append(file_path)
+        elif os.path.isfile(path) or path == '-':
+            files.append(path)
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            raise Exception("There is no file %s" % path)
+
+    if len(files) == 0:
+        raise Exception(f"No {kind} to process")
+    return files
+
+
 def check_dir_exists(dir_path, param=None):
     if not os.path.isdir(dir_path):
         raise Exception('KRYPTON cannot access the path provided to the '
@@ -74,6 +141,277 @@ def full_check_file(file_path):
         return False
 
 
+def sniff_compression(head):
+    """Return the compression format of a file from its first bytes (18 are
+    enough): 'bgzf', 'gzip', 'bzip2', 'xz', 'zstd' or None"""
+    if head[:2] == b'\x1f\x8b':
+        # BGZF is a gzip with an extra field 'BC' holding the block size
+        if len(head) >= 16 and head[3] & 4 and head[12:14] == b'BC':
+            return 'bgzf'
+        return 'gzip'
+    if head[:3] == b'BZh':
+        return 'bzip2'
+    if head[:6] == b'\xfd7zXZ\x00':
+        return 'xz'
+    if head[:4] == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    return None
+
+
+def _inflate_bgzf_block(block):
+    """Decompress one BGZF block and check its CRC"""
+    xlen = struct.unpack_from('<H', block, 10)[0]
+    data = zlib.decompress(block[12 + xlen:-8], -15)
+    crc, isize = struct.unpack_from('<II', block, len(block) - 8)
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise Exception("Corrupted BGZF block")
+    return data
+
+
+class BgzfReader(io.RawIOBase):
+    """Decompress a BGZF file (bgzip, samtools...) with several threads.
+    The file is made of independent gzip blocks of 64 kB at most, so they are
+    inflated in parallel by a pool of threads, as zlib releases the GIL, and
+    returned in order"""
+
+    def __init__(self, fileobj, threads=2):
+        self.fileobj = fileobj
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()  # Blocks being decompressed, in file order
+        self.max_pending = threads * 8
+        self.buffer = b''
+        self.offset = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def _read_block(self):
+        header = self.fileobj.read(18)
+        if len(header) == 0:
+            return None
+        if len(header) < 18 or sniff_compression(header) != 'bgzf':
+            raise Exception("Truncated or invalid BGZF block")
+        xlen = struct.unpack_from('<H', header, 10)[0]
+        extra = header[12:] + self.fileobj.read(xlen - 6)
+        # Find the subfield BC in the extra field: SI1, SI2, SLEN, BSIZE
+        pos = 0
+        while pos < xlen:
+            slen = struct.unpack_from('<H', extra, pos + 2)[0]
+            if extra[pos:pos + 2] == b'BC':
+                bsize = struct.unpack_from('<H', extra, pos + 4)[0]
+                break
+            pos += 4 + slen
+        else:
+            raise Exception("BGZF block without its size")
+        rest = self.fileobj.read(bsize + 1 - 12 - xlen)
+        return header[:12] + extra + rest
+
+    def _fill(self):
+        while not self.eof and len(self.pending) < self.max_pending:
+            block = self._read_block()
+            if block is None:
+                self.eof = True
+                break
+            self.pending.append(self.pool.submit(_inflate_bgzf_block, block))
+
+    def readinto(self, b):
+        while self.offset >= len(self.buffer):
+            self._fill()
+            if not self.pending:
+                return 0
+            self.buffer = self.pending.popleft().result()
+            self.offset = 0
+        size = min(len(b), len(self.buffer) - self.offset)
+        b[:size] = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+
+class _DecompressedStream(io.BufferedReader):
+    """Buffered decompressed stream that also closes the underlying file"""
+
+    def __init__(self, stream, raw_file):
+        super().__init__(stream, buffer_size=IO_BUFFER_SIZE)
+        self._raw_file = raw_file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._raw_file is not sys.stdin.buffer:
+                self._raw_file.close()
+
+
+def open_file(file_path, mode='rt', threads=1, encoding='utf-8'):
+    """Open a file for reading, compressed or not, '-' being STDIN.
+    The compression is found from the first bytes of the file (gzip, BGZF,
+    bzip2, xz or zstd), without decompressing anything, and the file is
+    only opened once. BGZF files are decompressed with 'threads' threads.
+    'mode' is 'rt' for text (default) or 'rb' for bytes"""
+    if mode not in ('r', 'rt', 'rb'):
+        raise ValueError(f"open_file() only reads files, not mode '{mode}'")
+
+    if file_path == '-':
+        raw = sys.stdin.buffer
+    else:
+        raw = open(file_path, 'rb', buffering=IO_BUFFER_SIZE)
+    compression = sniff_compression(raw.peek(18)[:18])
+
+    if compression is None:
+        stream = raw
+    elif compression == 'bgzf' and threads > 1:
+        stream = _DecompressedStream(BgzfReader(raw, threads), raw)
+    elif compression in ('gzip', 'bgzf'):
+        stream = _DecompressedStream(gzip.GzipFile(fileobj=raw), raw)
+    elif compression == 'bzip2':
+        stream = _DecompressedStream(bz2.BZ2File(raw), raw)
+    elif compression == 'xz':
+        stream = _DecompressedStream(lzma.LZMAFile(raw), raw)
+    else:
+        try:
+            import zstandard  # Optional, only for zstd files
+        except ImportError:
+            raw.close()
+            raise Exception(f"{file_path} is compressed with zstd, the "
+                            "module 'zstandard' is required to read it")
+        stream = _DecompressedStream(
+            zstandard.ZstdDecompressor().stream_reader(raw), raw)
+
+    if mode == 'rb':
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def open_output(file_path, compresslevel=6):
+    """Open a file to write bytes, '-' being STDOUT. It is compressed if its
+    extension is .gz, .bz2 or .xz, and the writes go through a large buffer,
+    so many small writes are cheap"""
+    if file_path == '-':
+        return io.BufferedWriter(os.fdopen(os.dup(sys.stdout.fileno()), 'wb',
+                                           buffering=0),
+                                 buffer_size=WRITE_BATCH_SIZE)
+
+    ext = file_path.lower()
+    if ext.endswith(('.gz', '.bgz')):
+        stream = gzip.open(file_path, 'wb', compresslevel=compresslevel)
+    elif ext.endswith('.bz2'):
+        stream = bz2.open(file_path, 'wb', compresslevel=compresslevel)
+    elif ext.endswith('.xz'):
+        stream = lzma.open(file_path, 'wb')
+    else:
+        return open(file_path, 'wb', buffering=WRITE_BATCH_SIZE)
+    return io.BufferedWriter(stream, buffer_size=WRITE_BATCH_SIZE)
+
+
+def file_fingerprint(file_path, content_hash=False):
+    """Return what identifies the current state of a file: its real path,
+    size and modification time, plus the BLAKE2 digest of its content if
+    'content_hash' is True (this reads the whole file)"""
+    stat = os.stat(file_path)
+    fingerprint = {'path': os.path.realpath(file_path), 'size': stat.st_size,
+                   'mtime_ns': stat.st_mtime_ns, 'hash': None}
+    if content_hash:
+        digest = hashlib.blake2b()
+        with open(file_path, 'rb') as fi:
+            for block in iter(lambda: fi.read(1024 * 1024), b''):
+                digest.update(block)
+        fingerprint['hash'] = digest.hexdigest()
+    return fingerprint
+
+
+def default_cache_path(name):
+    """Return the path of a cache file in $XDG_CACHE_HOME/bioinfoscripts/"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_dir, 'bioinfoscripts', name)
+
+
+class FileCache:
+    """A persistent cache for results computed from files, stored in a SQLite
+    database that can be shared by several processes.
+    An entry is only valid while the file keeps the size, modification time
+    and, if 'content_hash' is True, the content it had when the entry was
+    stored. The least recently used entries are dropped once the payloads
+    exceed 'max_size' bytes. 'namespace' separates the results of different
+    scripts or settings computed from the same file"""
+
+    def __init__(self, db_path, max_size=512 * 1024 ** 2, content_hash=False):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_size = max_size
+        self.content_hash = content_hash
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints = dict()  # Do not hash a file twice in get/put
+        self.db = sqlite3.connect(db_path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                        "namespace TEXT, path TEXT, size INTEGER, "
+                        "mtime_ns INTEGER, hash TEXT, payload BLOB, "
+                        "nbytes INTEGER, last_access REAL, "
+                        "PRIMARY KEY (namespace, path))")
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def get(self, file_path, namespace=''):
+        """Return the payload stored for the file, or None if there is no
+        entry or if the file changed since"""
+        fp = file_fingerprint(file_path, self.content_hash)
+        self._fingerprints[file_path] = fp
+        row = self.db.execute("SELECT size, mtime_ns, hash, payload FROM "
+                              "entries WHERE namespace = ? AND path = ?",
+                              (namespace, fp['path'])).fetchone()
+        if row is None or tuple(row[:2]) != (fp['size'], fp['mtime_ns']) or \
+                (self.content_hash and row[2] != fp['hash']):
+            self.misses += 1
+            return None
+
+        self.db.execute("UPDATE entries SET last_access = ? WHERE "
+                        "namespace = ? AND path = ?",
+                        (time.time(), namespace, fp['path']))
+        self.db.commit()
+        self.hits += 1
+        return row[3]
+
+    def put(self, file_path, payload, namespace=''):
+        """Store the payload (bytes) computed from the file, then evict the
+        least recently used entries if the cache is too big"""
+        fp = self._fingerprints.pop(file_path, None) or \
+            file_fingerprint(file_path, self.content_hash)
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?)",
+                        (namespace, fp['path'], fp['size'], fp['mtime_ns'],
+                         fp['hash'], payload, len(payload), time.time()))
+
+        total = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM "
+                                "entries").fetchone()[0]
+        if total > self.max_size:
+            rows = self.db.execute("SELECT namespace, path, nbytes FROM "
+                                   "entries ORDER BY last_access").fetchall()
+            for ns, path, nbytes in rows:
+                if total <= self.max_size:
+                    break
+                self.db.execute("DELETE FROM entries WHERE namespace = ? AND "
+                                "path = ?", (ns, path))
+                total -= nbytes
+        self.db.commit()
+        return True
+
+
 def time_used(timing, step=None):
     """This function prints the time taken by the system to run a step"""
     time_min = int((timing[1] - timing[0]) // 60)  # get the minutes
@@ -85,73 +423,1161 @@ def time_used(timing, step=None):
     return True
 
 
+_PROFILER = None  # The running Profiler, where the Timers report
+
+
+def _cpu_times():
+    """CPU time (user + system) of this process and of its terminated
+    children, e.g. the workers of a multiprocessing.Pool"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time(), children.ru_utime + children.ru_stime
+
+
+class Timer(contextlib.ContextDecorator):
+    """Measure the wall and CPU time of a stage of a script, as a context
+    manager or a function decorator:
+
+        with gu.Timer('read') as timer:
+            ...
+            timer.count(nbytes=len(data), records=1)
+
+        @gu.Timer('extract')
+        def extract(...):
+
+    The measures are added to the stage of the same name of the running
+    Profiler, if any, and printed like time_used() with 'verbose'"""
+
+    def __init__(self, name, verbose=False):
+        self.name = name
+        self.verbose = verbose
+        self._stack = []  # A decorated function can be recursive
+
+    def __enter__(self):
+        self._stack.append([time.time(), time.perf_counter(), _cpu_times(),
+                            0, 0])
+        return self
+
+    def count(self, nbytes=0, records=0):
+        """Add the bytes and records processed during the stage"""
+        self._stack[-1][3] += nbytes
+        self._stack[-1][4] += records
+        return True
+
+    def __exit__(self, *exc):
+        start, start_wall, (start_cpu, start_children), nbytes, records = \
+            self._stack.pop()
+        wall = time.perf_counter() - start_wall
+        cpu, children = _cpu_times()
+        if _PROFILER is not None:
+            _PROFILER.add(self.name, wall, cpu - start_cpu +
+                          children - start_children, nbytes, records)
+        if self.verbose:
+            time_used([start, time.time()], step=self.name)
+        return False
+
+
+class Profiler:
+    """Collect the stages measured by the Timers while it is running, and
+    write them as JSON to 'output' ('-' for STDERR): wall and CPU times,
+    bytes and records per second, and peak memory at the end of the stage.
+    With 'cprofile', the run is profiled by cProfile too, and its statistics
+    are dumped to this file (see pstats). Without both, it does nothing"""
+
+    def __init__(self, output=None, cprofile=None):
+        self.output = output
+        self.cprofile = cprofile
+        self.stages = {}
+        self._profile = None
+
+    def __enter__(self):
+        global _PROFILER
+        if self.output or self.cprofile:
+            _PROFILER = self
+            self._start = time.perf_counter(), _cpu_times()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def add(self, name, wall, cpu, nbytes=0, records=0, calls=1):
+        """Add the measures of one run of a stage"""
+        stage = self.stages.setdefault(name, {
+            'stage': name, 'calls': 0, 'wall_time': 0, 'cpu_time': 0,
+            'bytes': 0, 'records': 0})
+        stage['calls'] += calls
+        stage['wall_time'] += wall
+        stage['cpu_time'] += cpu
+        stage['bytes'] += nbytes
+        stage['records'] += records
+        stage['max_rss_mb'] = _peak_rss_mb()
+        return True
+
+    def merge(self, stages):
+        """Add the stages measured by another Profiler, e.g. in a worker
+        process, see ordered_map()"""
+        for stage in stages:
+            self.add(stage['stage'], stage['wall_time'], stage['cpu_time'],
+                     stage['bytes'], stage['records'], stage['calls'])
+        return True
+
+    def report(self):
+        """The stages, in their order of completion, and the whole run"""
+        stages = []
+        for stage in self.stages.values():
+            stage = dict(stage)
+            wall = stage['wall_time']
+            stage['mb_per_sec'] = round(stage['bytes'] / 1024 ** 2 / wall,
+                                        2) if wall and stage['bytes'] else None
+            stage['records_per_sec'] = round(stage['records'] / wall, 1) \
+                if wall and stage['records'] else None
+            stage['wall_time'] = round(wall, 4)
+            stage['cpu_time'] = round(stage['cpu_time'], 4)
+            stages.append(stage)
+        start_wall, (start_cpu, start_children) = self._start
+        cpu, children = _cpu_times()
+        return {'command': shlex.join(sys.argv),
+                'wall_time': round(time.perf_counter() - start_wall, 4),
+                'cpu_time': round(cpu - start_cpu + children - start_children,
+                                  4),
+                'max_rss_mb': _peak_rss_mb(), 'stages': stages}
+
+    def __exit__(self, *exc):
+        global _PROFILER
+        if self._profile:
+            self._profile.disable()
+            self._profile.dump_stats(self.cprofile)
+        if self.output:
+            report = json.dumps(self.report(), indent=2)
+            if self.output == '-':
+                print(report, file=sys.stderr)
+            else:
+                with open(self.output, 'w') as fo:
+                    print(report, file=fo)
+        _PROFILER = None
+        return False
+
+
+def add_profile_arguments(parser):
+    """Add --profile and --cprofile to the options of a script, to give to
+    Profiler()"""
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', help='Write the time, throughput and '
+                       'memory of each stage as JSON\nto this file, "-" for '
+                       'STDERR', metavar="")
+    group.add_argument('--cprofile', help='Dump the cProfile statistics to '
+                       'this file', metavar="")
+    return parser
+
+
+def _max_rss_mb(max_rss):
+    """ru_maxrss is in kilobytes on Linux, in bytes on macOS. On Linux, it
+    includes the child before exec(), i.e. about the size of this process"""
+    return round(max_rss / (1024 * 1024 if sys.platform == 'darwin'
+                            else 1024), 1)
+
+
+def _peak_rss_mb():
+    """Peak memory of this process and of its largest terminated child"""
+    return max(_max_rss_mb(resource.getrusage(who).ru_maxrss)
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def _start_job(command, log):
+    """Start a command, given as a string or a list of arguments, without a
+    shell. Return the process and the peak memory of this process at the
+    start: the peak memory of the command reported by wait4() is never below
+    it, as it includes the child before exec()"""
+    args = shlex.split(command) if isinstance(command, str) else command
+    rss_floor = _max_rss_mb(resource.getrusage(resource.RUSAGE_SELF)
+                            .ru_maxrss)
+    return subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT), \
+        rss_floor
+
+
+def _wait_job(proc):
+    """Wait for a process with wait4(), which returns its own resource usage,
+    unlike getrusage() that sums all the children. Return the exit code
+    (negative when killed by a signal) and the usage"""
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage
+
+
+def _job_result(name, command, status, exit_code=None, wall_time=None,
+                usage=None, rss_floor=None, error=None):
+    """Result of a job, with the fields of JOB_FIELDS. The times are in
+    seconds. A max_rss_mb at rss_floor_mb only tells that the command used
+    at most this memory"""
+    return {'name': name, 'status': status, 'exit_code': exit_code,
+            'wall_time': None if wall_time is None else round(wall_time, 3),
+            'user_time': usage and round(usage.ru_utime, 3),
+            'sys_time': usage and round(usage.ru_stime, 3),
+            'max_rss_mb': usage and _max_rss_mb(usage.ru_maxrss),
+            'rss_floor_mb': usage and rss_floor,
+            'command': command if isinstance(command, str) else
+            shlex.join(command),
+            'error': error}
+
+
 def run_command(command, log=subprocess.DEVNULL, step=None):
-    time_cmd = [time.time()]
-    subprocess.run(command.split(), stdout=log, stderr=subprocess.STDOUT)
-    time_cmd.append(time.time())
-    time_used(time_cmd, step=step)
+    """Run a command and print the time it took. Return its result, see
+    run_commands()"""
+    start = time.time()
+    try:
+        proc, rss_floor = _start_job(command, log)
+    except OSError as e:  # Command not found...
+        return _job_result(step or 'command', command, 'failed', 127,
+                           time.time() - start, error=str(e))
+    exit_code, usage = _wait_job(proc)
+    end = time.time()
+    time_used([start, end], step=step)
+    return _job_result(step or 'command', command,
+                       'ok' if exit_code == 0 else 'failed', exit_code,
+                       end - start, usage, rss_floor)
+
+
+def run_commands(commands, threads=1, fail_fast=False, log_dir=None,
+                 report=None):
+    """Run a batch of commands, at most 'threads' at the same time.
+    'commands' is a list of commands or a dict {name: command}; a command is
+    a string or a list of arguments, run without a shell.
+    The output of each command goes to '<log_dir>/<name>.log', or is dropped
+    if 'log_dir' is None.
+    With 'fail_fast', the first failure terminates the running commands
+    ('cancelled') and the others are not started ('skipped'). Otherwise all
+    the commands are run.
+    Return the results in the order of 'commands', each a dict with the
+    exit code, the wall time, the user and system CPU times and the peak
+    memory of the command, never below rss_floor_mb (JOB_FIELDS). They are
+    also written to 'report',
+    see write_job_report()"""
+    if isinstance(commands, dict):
+        jobs = list(commands.items())
+    else:
+        jobs = [(f"job_{i}", command) for i, command in enumerate(commands)]
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    running, cancelled = {}, set()
+
+    def _run(name, command):
+        start = time.time()
+        log = open(os.path.join(log_dir, name + '.log'), 'wb') if log_dir \
+            else subprocess.DEVNULL
+        try:
+            with lock:
+                if stop.is_set():
+                    return _job_result(name, command, 'skipped')
+                try:
+                    proc, rss_floor = _start_job(command, log)
+                except OSError as e:
+                    result = _job_result(name, command, 'failed', 127,
+                                         time.time() - start, error=str(e))
+                else:
+                    running[name] = proc
+                    result = None
+
+            if result is None:
+                exit_code, usage = _wait_job(proc)
+                with lock:
+                    del running[name]
+                    status = 'cancelled' if name in cancelled else \
+                        'ok' if exit_code == 0 else 'failed'
+                result = _job_result(name, command, status, exit_code,
+                                     time.time() - start, usage, rss_floor)
+        finally:
+            if log_dir:
+                log.close()
+
+        if fail_fast and result['status'] == 'failed':
+            with lock:
+                stop.set()
+                for other, proc in running.items():
+                    cancelled.add(other)
+                    proc.terminate()
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        futures = [executor.submit(_run, name, command)
+                   for name, command in jobs]
+        results = [future.result() for future in futures]
+
+    if report:
+        write_job_report(results, report)
+    return results
+
+
+def _profiled_call(task):
+    """Run a task of ordered_map() in a worker, with a Profiler of its own,
+    and return the result and the stages measured"""
+    global _PROFILER
+    function, task = task
+    _PROFILER = Profiler()
+    try:
+        return function(task), list(_PROFILER.stages.values())
+    finally:
+        _PROFILER = None
+
+
+def ordered_map(function, tasks, threads=1):
+    """Like map(), in a pool of 'threads' processes if there are more than
+    one. The results are yielded in the order of 'tasks', each as soon as it
+    is ready, and the pool is joined at the end, so that the CPU time of its
+    workers is known. The stages timed in the workers are added to the
+    running Profiler, their wall times summed over the workers"""
+    if threads > 1 and len(tasks) > 1:
+        profiler = _PROFILER
+        with multiprocessing.Pool(min(threads, len(tasks))) as pool:
+            chunksize = max(1, len(tasks) // (threads * 16))
+            if profiler is None:
+                yield from pool.imap(function, tasks, chunksize=chunksize)
+            else:
+                for result, stages in pool.imap(
+                        _profiled_call, [(function, task) for task in tasks],
+                        chunksize=chunksize):
+                    profiler.merge(stages)
+                    yield result
+            pool.close()
+            pool.join()
+    else:
+        yield from map(function, tasks)
+
+
+def write_job_report(results, file_path):
+    """Write the results of run_commands() as JSON if 'file_path' ends with
+    '.json', as a TSV table otherwise"""
+    with open(file_path, 'w') as fo:
+        if file_path.endswith('.json'):
+            json.dump(results, fo, indent=2)
+            fo.write('\n')
+            return True
+        print(*JOB_FIELDS, sep='\t', file=fo)
+        for result in results:
+            print(*('' if result[field] is None else result[field]
+                    for field in JOB_FIELDS), sep='\t', file=fo)
     return True
 
 
+def _fasta_records_mmap(mm, strip_newlines=True):
+    """Yield the (header, sequence) records of a memory-mapped FASTA file.
+    The records are found with find() over the whole mapping. Each
+    sequence is copied twice: sliced out of the mapping, then its line
+    breaks removed by translate(), so the peak memory is twice the longest
+    sequence. Without strip_newlines, it is copied once"""
+    size = len(mm)
+    start = 0 if mm[:1] == b'>' else mm.find(b'\n>') + 1
+    if start == 0 and mm[:1] != b'>':
+        return  # No record at all
+
+    while start < size:
+        eol = mm.find(b'\n', start)
+        if eol == -1:
+            eol = size
+        header = mm[start + 1:eol].rstrip()
+        nxt = mm.find(b'\n>', eol)
+        stop = size if nxt == -1 else nxt
+        if strip_newlines:
+            seq = mm[eol + 1:stop].translate(None, SEQ_WHITESPACE)
+        else:
+            end = stop
+            while end > eol + 1 and mm[end - 1] in b'\r\n':
+                end -= 1
+            seq = mm[eol + 1:end]
+        yield header, seq
+        start = stop + 1
+
+
+def _fasta_records_stream(fi, strip_newlines=True):
+    """Yield the (header, sequence) records of a FASTA file opened in binary
+    mode, line by line, each sequence being joined once"""
+    header, lines = None, []
+    for line in fi:
+        if line[:1] == b'>':
+            if header is not None:
+                seq = b''.join(lines)
+                yield header, seq.translate(None, SEQ_WHITESPACE) if \
+                    strip_newlines else seq.rstrip(b'\r\n')
+            header, lines = line[1:].rstrip(), []
+        elif header is not None:
+            lines.append(line)
+    if header is not None:  # DO NOT FORGET THE LAST SEQUENCE
+        seq = b''.join(lines)
+        yield header, seq.translate(None, SEQ_WHITESPACE) if \
+            strip_newlines else seq.rstrip(b'\r\n')
+
+
+def iter_fasta(file_path, strip_newlines=True, threads=1):
+    """Yield the records of a FASTA file one by one, as (header, sequence)
+    bytes, the header without the '>'. Nothing else is kept in memory.
+    Uncompressed files are memory-mapped, the others are decompressed on the
+    fly by open_file(). With strip_newlines=False, the sequence keeps its
+    original line breaks, except the last one"""
+    with open_file(file_path, 'rb', threads=threads) as fi:
+        # Only a regular and uncompressed file can be mapped, not a pipe.
+        # The decompressed streams have no file descriptor
+        if type(fi) is not io.BufferedReader or \
+                not stat.S_ISREG(os.fstat(fi.fileno()).st_mode):
+            yield from _fasta_records_stream(fi, strip_newlines)
+            return
+        info = os.fstat(fi.fileno())
+
+        if info.st_size == 0:
+            return
+        with mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield from _fasta_records_mmap(mm, strip_newlines)
+
+
+def _count_line_breaks(mm, start, stop, chunk_size=16 * IO_BUFFER_SIZE):
+    """Count the line break characters between start and stop in a memory
+    map, a chunk at a time so that a chromosome is never copied at once"""
+    num = 0
+    for pos in range(start, stop, chunk_size):
+        chunk = mm[pos:min(pos + chunk_size, stop)]
+        num += chunk.count(b'\n') + chunk.count(b'\r')
+    return num
+
+
+def _regular_lines(mm, offset, stop, length, line_bases, line_width):
+    """Check that all the lines of a sequence, except the last one, have
+    'line_bases' bases, which is required to compute the position of a base.
+    The line breaks are checked by slices of the memory map, not one by one"""
+    if line_bases == 0:
+        return False  # An empty line before the last one
+    num_breaks = line_width - line_bases
+    num_full = (length - 1) // line_bases  # Lines before the last one
+    end = offset + num_full * line_width
+    step = (16 * IO_BUFFER_SIZE // line_width) * line_width
+
+    for pos in range(offset, end, step):
+        chunk = mm[pos:min(pos + step, end)]
+        # Each line ends with its line break(s), and there are no others
+        if chunk[line_width - 1::line_width].strip(b'\n') or \
+                (num_breaks == 2 and
+                 chunk[line_width - 2::line_width].strip(b'\r')) or \
+                chunk.count(b'\n') + chunk.count(b'\r') != \
+                len(chunk) // line_width * num_breaks:
+            return False
+
+    last_line = mm[end:stop].rstrip(b'\r\n')
+    return len(last_line) == length - num_full * line_bases and \
+        b'\n' not in last_line
+
+
+def build_fai(fasta_path):
+    """Index an uncompressed FASTA file like 'samtools faidx' does, return a
+    dict name: (length, offset, line_bases, line_width). 'offset' is the
+    position of the first base in the file, 'line_bases' and 'line_width'
+    the number of bases and bytes (with the line break) of a full line"""
+    index = dict()
+    with open(fasta_path, 'rb') as fi:
+        if sniff_compression(fi.read(18)) is not None:
+            raise Exception(f"{fasta_path} is compressed, only uncompressed "
+                            "FASTA files can be indexed")
+        if os.fstat(fi.fileno()).st_size == 0:
+            return index
+
+        with mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            start = 0 if mm[:1] == b'>' else mm.find(b'\n>') + 1
+            if start == 0 and mm[:1] != b'>':
+                return index
+
+            while start < size:
+                eol = mm.find(b'\n', start)
+                eol = size if eol == -1 else eol
+                name = (mm[start + 1:eol].split(None, 1) or [b''])[0]
+                name = name.decode()
+                offset = min(eol + 1, size)
+                nxt = mm.find(b'\n>', eol)
+                stop = size if nxt == -1 else nxt + 1
+
+                # Only the first line is needed to get the line length
+                first_eol = mm.find(b'\n', offset, stop)
+                first_eol = stop if first_eol == -1 else first_eol + 1
+                first_line = mm[offset:first_eol]
+                line_width = len(first_line)
+                line_bases = len(first_line.rstrip(b'\r\n'))
+                length = stop - offset - _count_line_breaks(mm, offset, stop)
+
+                if length and not _regular_lines(mm, offset, stop, length,
+                                                 line_bases, line_width):
+                    raise Exception(f"The sequence {name} has lines of "
+                                    "different lengths, it cannot be indexed")
+
+                if name in index:
+                    raise Exception(f"The sequence name {name} is not unique")
+                index[name] = (length, offset, line_bases, line_width)
+                start = stop
+    return index
+
+
+def write_fai(index, fai_path):
+    """Write an index from build_fai() in the samtools format"""
+    with open(fai_path, 'w') as fo:
+        for name, values in index.items():
+            print(name, *values, sep='\t', file=fo)
+    return True
+
+
+def read_fai(fai_path):
+    """Read a .fai file, return a dict name: (length, offset, line_bases,
+    line_width)"""
+    index = dict()
+    with open(fai_path, 'r') as fi:
+        for line in fi:
+            fields = line.rstrip('\n').split('\t')
+            index[fields[0]] = tuple(int(v) for v in fields[1:5])
+    return index
+
+
+def is_fai_fresh(fasta_path, fai_path=None):
+    """Check that the index of a FASTA file exists and is more recent than
+    the FASTA file"""
+    fai_path = fai_path or fasta_path + '.fai'
+    return os.path.isfile(fai_path) and \
+        os.path.getmtime(fai_path) >= os.path.getmtime(fasta_path)
+
+
+class FastaIndex:
+    """Random access to the sequences of an uncompressed FASTA file, through
+    its samtools index (.fai). The index is read if it is up to date, or
+    built then saved next to the FASTA file (kept in memory only if the
+    directory is not writable).
+    Coordinates are 0-based and the end is excluded, like Python slices"""
+
+    def __init__(self, fasta_path, fai_path=None):
+        self.fasta_path = fasta_path
+        self.fai_path = fai_path or fasta_path + '.fai'
+        if is_fai_fresh(fasta_path, self.fai_path):
+            self.index = read_fai(self.fai_path)
+        else:
+            self.index = build_fai(fasta_path)
+            try:
+                write_fai(self.index, self.fai_path)
+            except OSError:
+                pass  # Read-only location, still usable from memory
+        self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def lengths(self):
+        """Return the length of all sequences, in the file order"""
+        return [values[0] for values in self.index.values()]
+
+    def record(self, name):
+        """Return the record 'name' as (header, sequence) bytes, like
+        iter_fasta(strip_newlines=False): the full defline without the '>',
+        and the sequence with its original line breaks"""
+        if name not in self.index:
+            raise KeyError(f"No sequence {name} in {self.fasta_path}")
+        length, offset = self.index[name][:2]
+        if self._fh is None:
+            self._fh = open(self.fasta_path, 'rb')
+
+        # The defline ends just before the sequence, find its beginning
+        window = 1024
+        while True:
+            start = max(0, offset - window)
+            self._fh.seek(start)
+            before = self._fh.read(offset - start)
+            gt = before.rfind(b'\n>', 0, len(before) - 1)
+            if gt != -1 or start == 0:
+                header = before[gt + 2 if gt != -1 else 1:].rstrip()
+                break
+            window *= 4
+
+        end = self._position(name, length - 1) + 1 if length else offset
+        self._fh.seek(offset)
+        return header, self._fh.read(end - offset)
+
+    def _position(self, name, pos):
+        """Byte position of the base 'pos' of the sequence 'name'"""
+        length, offset, line_bases, line_width = self.index[name]
+        return offset + (pos // line_bases) * line_width + pos % line_bases
+
+    def fetch(self, name, start=0, end=None):
+        """Return the sequence 'name', or its region [start, end), as bytes.
+        Only the bytes of the region are read from the file"""
+        if name not in self.index:
+            raise KeyError(f"No sequence {name} in {self.fasta_path}")
+        length = self.index[name][0]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return b''
+
+        if self._fh is None:
+            self._fh = open(self.fasta_path, 'rb')
+        first = self._position(name, start)
+        self._fh.seek(first)
+        data = self._fh.read(self._position(name, end - 1) + 1 - first)
+        return data.translate(None, SEQ_WHITESPACE)
+
+
+def _run_positions(starts, ends):
+    """All the positions of the runs [start, end), as one NumPy array"""
+    sizes = ends - starts
+    return np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + \
+        np.arange(sizes.sum())
+
+
+def _runs(values):
+    """Return the runs of identical non-zero values of a NumPy array, as
+    their starts, ends and values. The starts and ends are uint32, 9 bytes
+    a run with its value, unless the array is too long for it"""
+    dtype = np.uint32 if len(values) < 2 ** 32 else np.int64
+    if len(values) == 0:
+        return np.zeros(0, dtype=dtype), np.zeros(0, dtype=dtype), values
+    bounds = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.append(bounds, len(values))
+    keep = values[starts] != 0
+    return starts[keep].astype(dtype), ends[keep].astype(dtype), \
+        values[starts[keep]]
+
+
+def _packing_tables():
+    """Lookup tables of PackedSequences: the 2-bit code of each byte
+    (A, C, G, T -> 0, 1, 2, 3), the uppercase of each byte, the bytes that
+    are not a base, and the 4 bases and the number of each base in each
+    packed byte"""
+    codes = np.zeros(256, dtype=np.uint8)
+    upper = np.arange(256, dtype=np.uint8)
+    upper[ord('a'):ord('z') + 1] -= 32
+    other = np.ones(256, dtype=bool)
+    for code, base in enumerate(b'ACGT'):
+        codes[base] = codes[base + 32] = code
+        other[base] = other[base + 32] = False
+    shifts = np.array([6, 4, 2, 0], dtype=np.uint8)
+    unpacked = (np.arange(256, dtype=np.uint8)[:, None] >> shifts) & 3
+    counts = np.stack([(unpacked == code).sum(axis=1) for code in range(4)],
+                      axis=1)
+    return codes, upper, other, \
+        np.frombuffer(b'ACGT', dtype=np.uint8)[unpacked], counts
+
+
+class PackedSequences:
+    """A compact store of nucleotide sequences, at 2 bits per base: A, C, G
+    and T are packed 4 per byte, the other characters (N, IUPAC codes, gaps)
+    are kept as runs in a side table, as are the soft-masked (lowercase)
+    regions, like the UCSC .2bit format. The sequences are given back
+    exactly as they were added.
+    A run costs 8 bytes, 9 with its character: the store is smaller than
+    the sequences only when the runs are sparse, not e.g. for an alignment
+    with gaps every few columns or a sequence with scattered IUPAC codes.
+    Coordinates are 0-based and the end is excluded, like Python slices.
+    Requires NumPy"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self):
+        if np is None:
+            raise Exception("PackedSequences requires NumPy")
+        self._tables = _packing_tables()
+        self.index = dict()  # name: (length, packed, runs, masks)
+
+    @classmethod
+    def from_fasta(cls, file_path, threads=1):
+        """Pack all the sequences of a FASTA file, named after the first
+        word of their defline, like in the .fai index"""
+        packed = cls()
+        for header, seq in iter_fasta(file_path, threads=threads):
+            packed.add((header.split(None, 1) or [b''])[0].decode(), seq)
+        return packed
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, name):
+        return self.fetch(name)
+
+    def add(self, name, seq):
+        """Pack a sequence, given as bytes or str"""
+        if name in self.index:
+            raise Exception(f"The sequence {name} is already present")
+        if isinstance(seq, str):
+            seq = seq.encode()
+        codes, upper, other = self._tables[:3]
+        arr = np.frombuffer(seq, dtype=np.uint8)
+
+        # Pad to a multiple of 4 bases, then 4 codes in each byte
+        padded = np.zeros((len(arr) + 3) // 4 * 4, dtype=np.uint8)
+        padded[:len(arr)] = codes[arr]
+        quads = padded.reshape(-1, 4)
+        packed = (quads[:, 0] << 6) | (quads[:, 1] << 4) | \
+            (quads[:, 2] << 2) | quads[:, 3]
+
+        # The other characters are packed as A, they are restored from
+        # their runs
+        arr_upper = upper[arr]
+        others = np.where(other[arr], arr_upper, 0)
+        lowercase = (arr != arr_upper).view(np.int8)
+        self.index[name] = (len(arr), packed, _runs(others),
+                            _runs(lowercase)[:2])
+        return True
+
+    def names(self):
+        """Return the name of all sequences, in the order they were added"""
+        return list(self.index)
+
+    def lengths(self):
+        """Return the length of all sequences, in the order they were
+        added"""
+        return [values[0] for values in self.index.values()]
+
+    def length(self, name):
+        return self.index[name][0]
+
+    @property
+    def nbytes(self):
+        """Memory used by the sequences"""
+        return sum(packed.nbytes + sum(a.nbytes for a in runs + masks)
+                   for _, packed, runs, masks in self.index.values())
+
+    def fetch(self, name, start=0, end=None):
+        """Return the sequence 'name', or its region [start, end), as bytes.
+        Only the bytes of the region are unpacked"""
+        if name not in self.index:
+            raise KeyError(f"No sequence {name}")
+        length, packed, runs, masks = self.index[name]
+        end = length if end is None else min(end, length)
+        start = max(start, 0)
+        if start >= end:
+            return b''
+
+        first = start // 4
+        seq = self._tables[3][packed[first:(end + 3) // 4]].ravel()
+        seq = seq[start - first * 4:end - first * 4].copy()
+
+        for run_starts, run_ends, *chars in (runs, masks):
+            # The runs overlapping the region, cut to the region
+            i, j = np.searchsorted(run_ends, start, side='right'), \
+                np.searchsorted(run_starts, end)
+            if i == j:
+                continue
+            run_starts = np.maximum(run_starts[i:j].astype(np.intp),
+                                    start) - start
+            run_ends = np.minimum(run_ends[i:j].astype(np.intp), end) - start
+            positions = _run_positions(run_starts, run_ends)
+            if chars:
+                seq[positions] = np.repeat(chars[0][i:j],
+                                           run_ends - run_starts)
+            else:
+                seq[positions] |= 0x20  # Lowercase
+        return seq.tobytes()
+
+    def composition(self, name):
+        """Return the number of each character in the sequence 'name', case
+        insensitive, as a dict {'A': 123, 'C': 45, ...}"""
+        length, packed, (run_starts, run_ends, chars), _ = self.index[name]
+        counts = np.bincount(packed, minlength=256) @ self._tables[4]
+        run_sizes = (run_ends - run_starts).astype(np.intp)
+        # Remove the padding and the other characters, packed as A
+        counts[0] -= len(packed) * 4 - length + run_sizes.sum()
+        res = {base: int(n) for base, n in zip('ACGT', counts)}
+        for char, n in zip(chars.tolist(), run_sizes.tolist()):
+            res[chr(char)] = res.get(chr(char), 0) + n
+        return res
+
+    def save(self, file_path):
+        """Save the sequences in a binary file (NumPy .npz), see load()"""
+        arrays = {'version': np.array([self.FORMAT_VERSION]),
+                  'names': np.array(self.names(), dtype=str),
+                  'lengths': np.array(self.lengths(), dtype=np.int64)}
+        parts = list(zip(*(
+            (packed, *runs, *masks,
+             [len(packed), len(runs[0]), len(masks[0])])
+            for _, packed, runs, masks in self.index.values())))
+        for key, part in zip(('packed', 'run_starts', 'run_ends', 'chars',
+                              'mask_starts', 'mask_ends', 'sizes'), parts):
+            arrays[key] = np.concatenate(part) if key != 'sizes' else \
+                np.array(part, dtype=np.int64)
+        with open(file_path, 'wb') as fo:
+            np.savez(fo, **arrays)
+        return True
+
+    @classmethod
+    def load(cls, file_path):
+        """Load the sequences saved by save()"""
+        packed = cls()
+        with np.load(file_path, allow_pickle=False) as data:
+            if data['version'][0] != cls.FORMAT_VERSION:
+                raise Exception(f"{file_path}: unsupported format version")
+            if len(data['names']) == 0:
+                return packed
+            sizes = data['sizes'].T
+            bounds = [np.concatenate(([0], np.cumsum(size)))
+                      for size in sizes]
+            arrays = [data[key] for key in ('packed', 'run_starts', 'run_ends',
+                                            'chars', 'mask_starts',
+                                            'mask_ends')]
+            for i, (name, length) in enumerate(zip(data['names'].tolist(),
+                                                  data['lengths'].tolist())):
+                part = [array[bounds[k][i]:bounds[k][i + 1]] for array, k in
+                        zip(arrays, (0, 1, 1, 1, 2, 2))]
+                packed.index[name] = (length, part[0], tuple(part[1:4]),
+                                      tuple(part[4:]))
+        return packed
+
+
+def matrix_labels_path(file_path):
+    """Path of the file of the names of a matrix saved by save_matrix()"""
+    return os.path.splitext(file_path)[0] + '.labels.txt'
+
+
+def save_matrix(file_path, labels, matrix):
+    """Save a square matrix in a NumPy .npy file, and the names of its rows
+    (and columns) in a .labels.txt file next to it, one per line, see
+    load_matrix()"""
+    if matrix.shape != (len(labels), len(labels)):
+        raise ValueError(f"A {matrix.shape} matrix cannot have "
+                         f"{len(labels)} names")
+    with open(file_path, 'wb') as fo:
+        np.save(fo, matrix, allow_pickle=False)
+    with open(matrix_labels_path(file_path), 'w', encoding='utf-8') as fo:
+        fo.write(''.join(label + '\n' for label in labels))
+    return True
+
+
+def load_matrix(file_path, mmap=True):
+    """Load a matrix saved by save_matrix(). Return the names and the
+    matrix, memory-mapped read-only by default, so only the rows used are
+    read from the disk"""
+    with open(matrix_labels_path(file_path), encoding='utf-8') as fi:
+        labels = fi.read().splitlines()
+    matrix = np.load(file_path, mmap_mode='r' if mmap else None,
+                     allow_pickle=False)
+    if matrix.shape != (len(labels), len(labels)):
+        raise Exception(f"{file_path}: the matrix {matrix.shape} does not "
+                        f"match its {len(labels)} names")
+    return labels, matrix
+
+
+def iter_fastq(file_path, threads=1):
+    """Yield the records of a FASTQ file one by one, as (header, sequence,
+    quality) bytes, the header without the '@'. Each record is expected on
+    four lines, with as many qualities as bases"""
+    with open_file(file_path, 'rb', threads=threads) as fi:
+        while True:
+            header = fi.readline()
+            if not header:
+                return
+            if not header.strip():
+                continue  # Empty line at the end of the file
+            seq, plus, qual = fi.readline(), fi.readline(), fi.readline()
+            seq, qual = seq.rstrip(b'\r\n'), qual.rstrip(b'\r\n')
+            if header[:1] != b'@' or plus[:1] != b'+' or \
+                    len(qual) != len(seq):
+                raise Exception(f"Malformed FASTQ record in {file_path}: "
+                                f"{header.rstrip().decode()}")
+            yield header[1:].rstrip(), seq, qual
+
+
+def _peek_first_byte():
+    """First byte of STDIN, decompressed if needed, read from the buffer of
+    the stream without consuming it. b'' if it cannot be known, e.g. if the
+    buffer does not hold a complete bzip2 block"""
+    head = sys.stdin.buffer.peek(IO_BUFFER_SIZE)
+    compression = sniff_compression(head[:18])
+    try:
+        if compression is None:
+            return head[:1]
+        if compression in ('gzip', 'bgzf'):
+            return zlib.decompressobj(wbits=31).decompress(head, 1)
+        if compression == 'bzip2':
+            return bz2.BZ2Decompressor().decompress(head, 1)
+        if compression == 'xz':
+            return lzma.LZMADecompressor().decompress(head, 1)
+    except (OSError, EOFError, zlib.error, lzma.LZMAError):
+        pass
+    return b''
+
+
+def seq_file_format(file_path):
+    """Return 'fasta' or 'fastq' from the first character of a file, None
+    if it cannot be guessed (empty file...). STDIN is not consumed"""
+    if file_path == '-':
+        first = _peek_first_byte()
+    else:
+        with open_file(file_path, 'rb') as fi:
+            first = fi.read(1)
+    return {b'>': 'fasta', b'@': 'fastq'}.get(first)
+
+
 def read_fasta(file_path):
     try:
-        is_file_exists(file_path)
+        if file_path != '-':
+            is_file_exists(file_path)
     except Exception:
         print("For DEVs: Something went wrong with the file %s" % file_path)
     d = dict()  # From Python 3.6, dict() keep the insertion order
 
-    with open(file_path, 'r') as fi:
-        lines = fi.readlines()
-        curr_k = ""
-        curr_v = ""
-        for line in lines:
-            line = line.rstrip()
-            if line[0] == ">":
-                if curr_k != "":
-                    # populate the dict with the previous complete sequence
-                    d[curr_k] = curr_v
-                curr_k = line
-                curr_v = ""  # reset of the previous sequence
-            else:
-                curr_v += line
-        d[curr_k] = curr_v  # DO NOT FORGET THE LAST SEQUENCE
+    for header, seq in iter_fasta(file_path):
+        d[">" + header.decode()] = seq.decode()
     return d
 
 
-def multi_to_single_line_fasta(file_path):
-    d = read_fasta(file_path)
-    # Write
-    with open(file_path + ".oneline.pep", "w") as fo:
-        for k, v in d.items():
-            print("%s\n%s" % (k, v), file=fo)
-    return True
+def _fasta_blocks(file_path, block_size=16 * IO_BUFFER_SIZE):
+    """Read a Fasta file by blocks of complete records, each block starting
+    with a '>', yielded as ('records', block). A record bigger than
+    'block_size' is yielded in pieces of whole lines instead: its defline
+    and the start of its sequence ('start'), then the rest of its sequence
+    ('sequence'). The chunks read are only joined once a block is complete,
+    so a large record is not copied again at each chunk"""
+    with open_file(file_path, 'rb') as fi:
+        parts, size = [], 0  # The chunks of the current block
+        started, in_record, after_eol = False, False, True
+        for chunk in iter(lambda: fi.read(block_size), b''):
+            # The first and the last records starting in the chunk, -1 if
+            # none
+            at_start = after_eol and chunk[:1] == b'>'
+            first = 0 if at_start else chunk.find(b'\n>') + 1 or -1
+            last = chunk.rfind(b'\n>') + 1 or (0 if at_start else -1)
+            after_eol = chunk[-1:] == b'\n'
+            if first != -1 and (in_record or not started):
+                # The end of a big record, or what is before the first one
+                if in_record and first:
+                    parts.append(chunk[:first])
+                    size += first
+                if size:
+                    yield 'sequence', b''.join(parts)
+                parts, size, in_record, started = [], 0, False, True
+                chunk, last = chunk[first:], last - first
+            elif not started:
+                continue
+
+            if last != -1:
+                if last:
+                    parts.append(chunk[:last])
+                    size += last
+                if size:
+                    yield 'sequence' if in_record else 'records', \
+                        b''.join(parts)
+                parts, size, in_record = [chunk[last:]], len(chunk) - last, \
+                    False
+                continue
+
+            parts.append(chunk)
+            size += len(chunk)
+            if size < block_size:
+                continue
+            # A single record, too big for a block: yield its whole lines
+            data = b''.join(parts)
+            if not in_record and data.find(b'\n') == -1:
+                continue  # Not even the whole defline yet
+            cut = data.rfind(b'\n') + 1 or len(data) - data.endswith(b'\r')
+            yield 'sequence' if in_record else 'start', data[:cut]
+            parts, size, in_record = [data[cut:]], len(data) - cut, True
+
+        if size:
+            yield 'sequence' if in_record else 'records', b''.join(parts)
+
+
+def _fasta_block_bounds(arr):
+    """Return the position of the '>' and of the end of the defline of each
+    record in a block from _fasta_blocks(), as a NumPy uint8 array ending
+    with a line break"""
+    line_ends = np.flatnonzero(arr == ord('\n'))
+    line_starts = line_ends[:-1] + 1
+    starts = np.concatenate(([0], line_starts[arr[line_starts] == ord('>')]))
+    header_ends = line_ends[np.searchsorted(line_ends, starts)]
+    return starts, header_ends
+
+
+def _single_line_fasta_block(block):
+    """Remove the line breaks in the sequences of a block of records, with a
+    mask over the whole block instead of a loop over the records. Same
+    output as the records of iter_fasta()"""
+    if block[-1:] != b'\n':
+        block += b'\n'
+    arr = np.frombuffer(block, dtype=np.uint8)
+    starts, header_ends = _fasta_block_bounds(arr)
+    # SEQ_WHITESPACE, i.e. ' ' and '\t' to '\r', in three operations
+    keep = ((arr - ord('\t')) > ord('\r') - ord('\t')) & (arr != ord(' '))
+
+    # A line break after the sequences, unless they are empty
+    bounds = np.empty(2 * len(starts), dtype=np.intp)
+    bounds[0::2], bounds[1:-1:2], bounds[-1] = header_ends, starts[1:] - 1, \
+        len(arr) - 1
+    keep[bounds[1::2]] = np.logical_or.reduceat(keep, bounds[:-1])[0::2]
+
+    # The deflines are kept as they are, without their trailing whitespaces
+    sizes = header_ends - starts
+    positions = _run_positions(starts, header_ends)
+    last = np.maximum.reduceat(np.where(keep[positions], positions, -1),
+                               np.cumsum(sizes) - sizes)
+    keep[positions] = positions <= np.repeat(last, sizes)
+    keep[header_ends] = True
+    return arr[keep].tobytes()
 
 
-def simplify_seq_id(count, string_size):
-    """
-    input a number, eg 361, return a string of size 'size'
-    with X leading 0s. Eg 000000361 for num=361, size=9
-    """
-    if len(str(count)) <= string_size:
-        return ("0" * (string_size - len(str(count)))) + str(count)
+def _clean_fasta_block(block, new_name, count):
+    """Rename the records of a block, see clean_deflines(). Return the new
+    block and the lines of the correspondence table"""
+    block = block.replace(b'\r\n', b'\n')
+    if block[-1:] != b'\n':
+        block += b'\n'
+    starts, header_ends = _fasta_block_bounds(np.frombuffer(block,
+                                                            dtype=np.uint8))
+    starts, header_ends = starts.tolist(), header_ends.tolist()
+    ends = starts[1:] + [len(block)]
+    names = [new_name % i for i in range(count, count + len(starts))]
+    seqs = [block[header_end + 1:end].rstrip(b'\r\n')
+            for header_end, end in zip(header_ends, ends)]
+
+    out = b''.join([b'>%s\n%s\n' % (name, seq) if seq else b'>%s\n' % name
+                    for name, seq in zip(names, seqs)])
+    corres = b''.join([b'%s\t%s\n' % (block[start + 1:header_end].rstrip(),
+                                       name)
+                       for name, start, header_end in zip(names, starts,
+                                                          header_ends)])
+    return out, corres
+
+
+def _records_to_write(file_path, strip_newlines=True):
+    """Yield the records of a Fasta or Fastq file as (marker, header, body),
+    'body' being the lines after the defline, ready to be written"""
+    if seq_file_format(file_path) == 'fastq':
+        for header, seq, qual in iter_fastq(file_path):
+            yield b'@', header, seq + b'\n+\n' + qual + b'\n'
     else:
-        raise Exception("For DEVs: You did not expected some many sequences..."
-                        + f"There are at least {count} sequences")
+        for header, seq in iter_fasta(file_path, strip_newlines):
+            yield b'>', header, seq + b'\n' if seq else b''
+
 
+def multi_to_single_line_fasta(file_path, outfile=None):
+    """Write each sequence of a Fasta (or Fastq) file on a single line, in
+    'outfile', compressed according to its extension. Default is
+    '<file_path>.oneline.pep'. The file is streamed, and transformed by
+    blocks of records when NumPy is available"""
+    outfile = outfile or file_path + ".oneline.pep"
+    with open_output(outfile) as fo:
+        if np is not None and seq_file_format(file_path) != 'fastq':
+            has_bases = False  # Of a record too big for a block
+            for kind, block in _fasta_blocks(file_path):
+                if kind != 'sequence' and has_bases:
+                    fo.write(b'\n')  # The end of the big record
+                    has_bases = False
+                if kind == 'records':
+                    fo.write(_single_line_fasta_block(block))
+                    continue
+                if kind == 'start':
+                    eol = block.find(b'\n')
+                    fo.write(block[:eol].rstrip() + b'\n')
+                    block = block[eol + 1:]
+                seq = block.translate(None, SEQ_WHITESPACE)
+                fo.write(seq)
+                has_bases = has_bases or bool(seq)
+            if has_bases:
+                fo.write(b'\n')
+            return True
+
+        batch, batch_size = [], 0
+        for marker, header, body in _records_to_write(file_path):
+            batch.append(marker + header + b'\n' + body)
+            batch_size += len(body)
+            if batch_size >= WRITE_BATCH_SIZE:
+                fo.write(b''.join(batch))
+                batch, batch_size = [], 0
+        fo.write(b''.join(batch))
+    return True
+
+
+def clean_deflines(infile, seq_prefix, name_size=9, outfile=None,
+                   corres_file=None):
+    """Rename the sequences '<seq_prefix>_000000000', '..._000000001'...
+    The renamed sequences are written in 'outfile' (default is
+    '<infile>.clean_defline.fa') and the correspondence between the old and
+    the new names in 'corres_file' (default is '<infile>.corres_tab.tsv').
+    Fasta and Fastq files are supported, compressed or not. The file is
+    streamed, and transformed by blocks of records when NumPy is available"""
+    outfile = outfile or infile + ".clean_defline.fa"
+    corres_file = corres_file or infile + ".corres_tab.tsv"
+    max_count = 10 ** name_size
+    new_name = f"{seq_prefix}_%0{name_size}d".encode()
+    too_many = "For DEVs: You did not expected some many sequences... " + \
+        "There are at least {} sequences"
 
-def clean_deflines(infile, seq_prefix, name_size=9):
     count = 0
-    with open(infile, "r") as fi:
-        with open(infile + ".clean_defline.fa", "w") as fo:
-            with open(infile + ".corres_tab.tsv", "w") as corres:
-                lines = fi.readlines()
-                for line in lines:
-                    line = line.rstrip()
-                    if line[0] == ">":
-                        new_s = f">{seq_prefix}_{simplify_seq_id(count, name_size)}"
-                        print(new_s, file=fo)
-                        print(line[1:], new_s[1:], sep="\t", file=corres)
-                        count += 1
-                    else:
-                        print(line, file=fo)
+    with open_output(outfile) as fo, open_output(corres_file) as corres:
+        if np is not None and seq_file_format(infile) != 'fastq':
+            # The line breaks at the end of a record too big for a block,
+            # not written until more sequence comes
+            held, has_seq = None, False
+            for kind, block in _fasta_blocks(infile):
+                if kind != 'sequence' and held is not None:
+                    if has_seq:
+                        fo.write(b'\n')  # The end of the big record
+                    held = None
+                if kind == 'records':
+                    out, corres_lines = _clean_fasta_block(block, new_name,
+                                                           count)
+                    count += corres_lines.count(b'\n')
+                    if count > max_count:
+                        raise Exception(too_many.format(count))
+                    fo.write(out)
+                    corres.write(corres_lines)
+                    continue
+                if kind == 'start':
+                    if count >= max_count:
+                        raise Exception(too_many.format(count + 1))
+                    eol = block.find(b'\n')
+                    name = new_name % count
+                    fo.write(b'>%s\n' % name)
+                    corres.write(b'%s\t%s\n' % (block[1:eol].rstrip(), name))
+                    count += 1
+                    held, has_seq, block = b'', False, block[eol + 1:]
+                seq = block.rstrip(b'\r\n')
+                if seq:
+                    fo.write(held.replace(b'\r\n', b'\n'))
+                    fo.write(seq.replace(b'\r\n', b'\n'))
+                    held, has_seq = block[len(seq):], True
+                else:
+                    held += block
+            if has_seq and held is not None:
+                fo.write(b'\n')
+            return True
+
+        batch, corres_batch, batch_size = [], [], 0
+        # The sequences keep their line breaks
+        for marker, header, body in _records_to_write(infile,
+                                                      strip_newlines=False):
+            if count >= max_count:
+                raise Exception(too_many.format(count))
+            name = new_name % count
+            body = body.replace(b'\r\n', b'\n')
+            batch.append(marker + name + b'\n' + body)
+            corres_batch.append(header + b'\t' + name + b'\n')
+            batch_size += len(body)
+            count += 1
+
+            if batch_size >= WRITE_BATCH_SIZE:
+                fo.write(b''.join(batch))
+                corres.write(b''.join(corres_batch))
+                batch, corres_batch, batch_size = [], [], 0
+
+        fo.write(b''.join(batch))
+        corres.write(b''.join(corres_batch))
     return True
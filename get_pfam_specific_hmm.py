@@ -3,12 +3,13 @@ import os
 import sys
 import argparse
 from argparse import RawTextHelpFormatter
+import generic_utils as gu
 
 
 def parse_list(infile):
     """ This function read the input list and return the result as a list"""
     mylist = list()
-    with open(infile, 'r') as fi:
+    with gu.open_file(infile) as fi:
         for line in fi.readlines():
             mylist.append(line.rstrip().upper())
 
@@ -17,6 +18,7 @@ def parse_list(infile):
     return mylist
 
 
+@gu.Timer('extract_pf_of_interest')
 def extract_pf_of_interest(pfam, domains):
     """Take the Pfam-A.hmm and a list of domain
         return a dict with the Pfam ID and all lines to reconstitute the
@@ -29,7 +31,7 @@ def extract_pf_of_interest(pfam, domains):
     current_pf_id = ""
 
     # Loop
-    with open(pfam, 'r') as fi:
+    with gu.open_file(pfam) as fi:
         for line in fi.readlines():
             line = line.rstrip()
 
@@ -76,13 +78,15 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
 
-    parser.add_argument('-i', help='The Pfam-A.hmm file', metavar="",
+    parser.add_argument('-i', help='The Pfam-A.hmm file, can be compressed',
+                        metavar="",
                         required=True)
     parser.add_argument('--pf', help='a single-column file with the Pfam ID to'
                         ' extract.\nExpected format: "PF\\d{5}"', metavar="",
                         required=True)
     parser.add_argument('-o', help='Directory to store the single profiles',
                         metavar='', required=True)
+    gu.add_profile_arguments(parser)
 
     if len(sys.argv) == 1:  # In the case where nothing is provided
         parser.print_usage(file=sys.stderr)
@@ -90,22 +94,26 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
     try:
-        # Output exists? Kill the script
-        if os.path.isdir(args.o):
-            raise Exception('The script does not overwrite files or ' +
-                            'directories. Make sure the directory provided ' +
-                            'DO NOT exists.')
-
-        # Read the list of PF ids
-        print("read the list of pfams")
-        pf_list = parse_list(args.pf)
-
-        # Parse the main Pfam file and extract the one we wants
-        print('parse the master Pfam file')
-        my_pfams = extract_pf_of_interest(args.i, pf_list)
-
-        # Print
-        print_files(args.o, my_pfams)
+        with gu.Profiler(args.profile, args.cprofile):
+            # Output exists? Kill the script
+            if os.path.isdir(args.o):
+                raise Exception('The script does not overwrite files or ' +
+                                'directories. Make sure the directory '
+                                'provided DO NOT exists.')
+
+            # Read the list of PF ids
+            print("read the list of pfams")
+            with gu.Timer('read_list'):
+                pf_list = parse_list(args.pf)
+
+            # Parse the main Pfam file and extract the one we wants
+            print('parse the master Pfam file')
+            my_pfams = extract_pf_of_interest(args.i, pf_list)
+
+            # Print
+            with gu.Timer('write') as timer:
+                print_files(args.o, my_pfams)
+                timer.count(records=len(my_pfams))
 
     except Exception as e:
         # Something went wrong with the arguments?!
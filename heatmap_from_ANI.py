@@ -2,14 +2,21 @@
 
 import os
 import sys
+import zlib
+import sqlite3
 import argparse
-# import numpy as np
+import numpy as np
 import pandas as pd
 import seaborn as sns
-# import matplotlib as mpl
-from matplotlib import pyplot as plt
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import squareform
+import matplotlib
+matplotlib.use('Agg')  # Only files are written, no display needed
+from matplotlib import pyplot as plt  # noqa: E402
 from argparse import RawTextHelpFormatter
 
+import generic_utils as gu
+
 """
 Future updates:
     - Add a description in the script
@@ -18,15 +25,76 @@ Future updates:
 
 
 def read_ani(fh):
-    ani_df = pd.read_table(fh, sep='\t', index_col=0)
+    if fh.endswith('.npy'):
+        # Binary matrix with its .labels.txt file, memory-mapped
+        labels, matrix = gu.load_matrix(fh)
+        return pd.DataFrame(matrix, index=labels, columns=labels, copy=False)
+    with gu.open_file(fh) as fi:
+        ani_df = pd.read_table(fi, sep='\t', index_col=0)
     return ani_df
 
 
-def plot_heatmap(df, out_base):
-
-    g = sns.clustermap(data=df.multiply(100), metric="seuclidean",
-                       standard_scale=None, figsize=(15, 15),
-                       cmap='YlOrBr')
+def ani_percent(df):
+    """Return the ANI in %, whatever the scale of the matrix: fractions
+    (pyANI, diagonal of 1) are multiplied by 100, a matrix already in %
+    (diagonal of 100) is returned as it is"""
+    if np.nanmax(np.diagonal(df.to_numpy())) <= 1:
+        return df.multiply(100)
+    return df
+
+
+def ani_linkage(df, method='average'):
+    """Cluster the genomes once, for both axes: the ANI (in %) is turned
+    directly into a condensed distance, 100 - ANI, the two values of a pair
+    being averaged"""
+    ani = df.to_numpy(dtype=np.float32)
+    distance = 100 - (ani + ani.T) / 2
+    del ani
+    if distance.min() < -0.01:
+        raise Exception("Some ANI values are above 100%, the matrix is not "
+                        "a matrix of ANI in % or fractions")
+    np.clip(distance, 0, None, out=distance)  # Rounding errors only
+    return hierarchy.linkage(squareform(distance, checks=False),
+                             method=method)
+
+
+def cached_linkage(matrix_file, df, method, cache_path):
+    """Run ani_linkage() through a persistent cache, checked against the
+    content of the matrix file, so plotting it again with other options
+    does not cluster it again. 'cache_path' None disables the cache"""
+    if not cache_path:
+        return ani_linkage(df, method)
+
+    # 'v2': the linkage of the ANI in %, whatever the scale of the matrix
+    namespace = 'linkage v2 ' + method
+    try:
+        with gu.FileCache(cache_path, content_hash=True) as cache:
+            payload = cache.get(matrix_file, namespace=namespace)
+            if payload is not None:
+                return np.frombuffer(zlib.decompress(payload)).reshape(-1, 4)
+
+            linkage = ani_linkage(df, method)
+            cache.put(matrix_file, zlib.compress(linkage.tobytes()),
+                      namespace=namespace)
+            return linkage
+
+    except (sqlite3.Error, OSError) as e:
+        # A broken, locked or unwritable cache must not prevent to plot the
+        # heatmap
+        print(f"Cache not used: {e}", file=sys.stderr)
+        return ani_linkage(df, method)
+
+
+def plot_heatmap(df, out_base, linkage=None):
+
+    if linkage is None:
+        g = sns.clustermap(data=df, metric="seuclidean",
+                           standard_scale=None, figsize=(15, 15),
+                           cmap='YlOrBr')
+    else:
+        g = sns.clustermap(data=df, row_linkage=linkage,
+                           col_linkage=linkage, figsize=(15, 15),
+                           cmap='YlOrBr')
 
     g.fig.suptitle('ANI results (in % - pyANI)', y=1, fontsize=16)
 
@@ -35,14 +103,89 @@ def plot_heatmap(df, out_base):
     return True
 
 
+def block_average(ani, max_size):
+    """Downsample a square matrix to at most 'max_size' rows and columns,
+    each cell being the mean of a block of cells"""
+    factor = -(-len(ani) // max_size)
+    if factor <= 1:
+        return ani
+    starts = np.arange(0, len(ani), factor)
+    sizes = np.diff(np.append(starts, len(ani))).astype(np.float32)
+    sums = np.add.reduceat(np.add.reduceat(ani, starts, axis=0), starts,
+                           axis=1)
+    return sums / np.outer(sizes, sizes)
+
+
+def plot_large_heatmap(df, out_base, linkage, max_size=2000):
+    """Heatmap for thousands of genomes: the matrix, in the order of the
+    clustering, is block-averaged down to 'max_size' cells per side and
+    drawn as a single image, so the SVG embeds a bitmap instead of one path
+    per cell. The dendrograms are rasterized too, and there are no labels.
+    The figure is built once for both the PNG and the SVG"""
+    order = hierarchy.leaves_list(linkage)
+    ani = block_average(df.to_numpy(dtype=np.float32)[np.ix_(order, order)],
+                        max_size)
+
+    fig = plt.figure(figsize=(15, 15))
+    ax_rows = fig.add_axes([0.02, 0.05, 0.13, 0.75])
+    ax_cols = fig.add_axes([0.16, 0.81, 0.75, 0.13])
+    ax_heat = fig.add_axes([0.16, 0.05, 0.75, 0.75])
+    ax_cbar = fig.add_axes([0.93, 0.05, 0.02, 0.3])
+
+    for ax, orientation in ((ax_rows, 'left'), (ax_cols, 'top')):
+        hierarchy.dendrogram(linkage, orientation=orientation, ax=ax,
+                             no_labels=True, color_threshold=0,
+                             above_threshold_color='black')
+        for collection in ax.collections:
+            collection.set_linewidth(0.3)
+            collection.set_rasterized(True)
+        ax.set_axis_off()
+
+    # The first leaf is at the bottom of the left dendrogram
+    image = ax_heat.imshow(ani, cmap='YlOrBr', aspect='auto', origin='lower',
+                           interpolation='nearest')
+    ax_heat.set_xticks([])
+    ax_heat.set_yticks([])
+    fig.colorbar(image, cax=ax_cbar)
+    fig.suptitle(f'ANI results (in % - pyANI), {len(df)} genomes', y=0.98,
+                 fontsize=16)
+
+    fig.savefig(out_base + ".png", dpi=300, facecolor='white')
+    fig.savefig(out_base + ".svg", dpi=150)
+    plt.close(fig)
+    return True
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
     parser.add_argument('out_name', help='A prefix for the figure files')
-    parser.add_argument('ani_matrix', help='A square matrix from PyANI')
+    parser.add_argument('ani_matrix', help='A square matrix from PyANI, or a '
+                        '.npy matrix with its\n.labels.txt file')
     parser.add_argument('--table', help='A two columns table to change IDs '
                         'in heatmap, in TSV', metavar="")
+    parser.add_argument('--linkage', help='Cluster the genomes once on 100 - '
+                        'ANI with this method,\ninstead of the standardized '
+                        'euclidean distance\nbetween the rows. Much faster '
+                        'for many genomes',
+                        choices=['average', 'complete', 'single', 'weighted'])
+    parser.add_argument('--cache', help='SQLite file caching the clustering '
+                        'of --linkage - \n["' +
+                        gu.default_cache_path('heatmap_from_ANI.sqlite') +
+                        '"]', default=gu.default_cache_path(
+                            'heatmap_from_ANI.sqlite'), metavar="")
+    parser.add_argument('--no_cache', '--no-cache', help='Do not use the '
+                        'cache', default=False, action='store_true')
+    parser.add_argument('--large', help='Mode for thousands of genomes: '
+                        'clustering as\n--linkage (average by default), a '
+                        'downsampled\nheatmap drawn as an image, no labels',
+                        default=False, action='store_true')
+    parser.add_argument('--max_size', help='With --large, maximum number of '
+                        'cells per side\nof the heatmap, larger matrices are '
+                        'block-\naveraged - [2000]', default=2000, type=int,
+                        metavar="")
     # parser.add_argument('--no_header', help='Do not print the headers',
     #                     default=False, action='store_true')
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -51,23 +194,43 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        # Check input/output files
-        if not os.path.isfile(args.ani_matrix):
-            raise Exception("There is no file %s" % args.ani_matrix)
-        if os.path.isfile(args.out_name + '.png'):
-            raise Exception("The outfile is already present: %s\n"
-                            % args.out_name)
-
-        if args.table:
-            if not os.path.isfile(args.table):
-                raise Exception("There is no file %s" % args.table)
-
-        # Read matrix
-        ani_df = read_ani(args.ani_matrix)
-        # Plot
-        plot_heatmap(ani_df, args.out_name)
-
-        print("Done: %s" % args.out_name + '.{png,svg}')
+        with gu.Profiler(args.profile, args.cprofile):
+            # Check input/output files
+            if not os.path.isfile(args.ani_matrix):
+                raise Exception("There is no file %s" % args.ani_matrix)
+            if os.path.isfile(args.out_name + '.png'):
+                raise Exception("The outfile is already present: %s\n"
+                                % args.out_name)
+
+            if args.table:
+                if not os.path.isfile(args.table):
+                    raise Exception("There is no file %s" % args.table)
+
+            # Read matrix
+            with gu.Timer('read') as timer:
+                ani_df = ani_percent(read_ani(args.ani_matrix))
+                timer.count(nbytes=os.path.getsize(args.ani_matrix),
+                            records=len(ani_df))
+            # Cluster
+            if args.large and not args.linkage:
+                args.linkage = 'average'
+            linkage = None
+            if args.linkage:
+                with gu.Timer('linkage') as timer:
+                    linkage = cached_linkage(
+                        args.ani_matrix, ani_df, args.linkage,
+                        None if args.no_cache else args.cache)
+                    timer.count(records=len(ani_df))
+
+            # Plot
+            with gu.Timer('plot'):
+                if args.large:
+                    plot_large_heatmap(ani_df, args.out_name, linkage,
+                                       args.max_size)
+                else:
+                    plot_heatmap(ani_df, args.out_name, linkage)
+
+            print("Done: %s" % args.out_name + '.{png,svg}')
 
     except Exception as e:
         # Something went wrong with the arguments?!
@@ -7,6 +7,7 @@ import sys
 import argparse
 from argparse import RawTextHelpFormatter
 from ete3 import NCBITaxa
+import generic_utils as gu
 
 # Future updates:
 #  - Add a description in the script
@@ -86,6 +87,7 @@ if __name__ == "__main__":
                         default=False)
     parser.add_argument('--no-header', help='Do not print the ranks names',
                         action='store_true', default=False)
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -94,58 +96,62 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        # Some sanity checks:
-        if args.classic:
-            args.no_clade = True
-
-        # Load the database
-        ncbi = NCBITaxa()
-
-        # If the user wants to update its local database; then clean the file
-        if args.update:
-            ncbi.update_taxonomy_database()
-            os.remove('taxdump.tar.gz')
-
-        # Get the full lineage of the given taxid
-        lineage = ncbi.get_lineage(args.taxid)
-
-        # Translate all taxids into the names
-        names = ncbi.get_taxid_translator(lineage)
-
-        # Get the ranks for each taxid in the lineage
-        ranks = ncbi.get_rank(lineage)
-
-        # Merge both informations, as a list of tuples
-        my_lineage = [tuple(item) for item in zip(
-                        [ranks[taxid] for taxid in lineage],
-                        [names[taxid] for taxid in lineage])]
-        # Delete ranks named 'no rank'
-        # ## Pop items from the end of the list, otherwise it is a big messed
-        # ## with the indices!
-        # ## The user can choose to drop ranks called "clade"
-
-        for i in range(len(my_lineage) - 1, -1, -1):
-            # Case where the user asked for a "classic" taxonomy
+        with gu.Profiler(args.profile, args.cprofile):
+            # Some sanity checks:
             if args.classic:
-                if my_lineage[i][0] not in classic_ranks:
-                    del my_lineage[i]
-            else:
-                # Make the checks for the other cases
-                if my_lineage[i][0] == 'no rank':
-                    del my_lineage[i]
-                if (args.no_clade) and (my_lineage[i][0] == 'clade'):
-                    del my_lineage[i]
-
-        # Print the result
-        if not args.no_header:
-            # Enter this block if user do not specify "--no-header"
-            print_values(my_lineage, add_id=args.id, headers=True,
-                         classic=args.classic)
-        print_values(my_lineage, add_id=args.id, classic=args.classic)
-
-        # This is a way of printing the FULL lineage:
-        #   print('\t'.join([ranks[taxid] for taxid in lineage]))
-        #   print('\t'.join([names[taxid] for taxid in lineage]))
+                args.no_clade = True
+
+            # Load the database
+            with gu.Timer('database'):
+                ncbi = NCBITaxa()
+
+                # If the user wants to update its local database; then clean
+                # the file
+                if args.update:
+                    ncbi.update_taxonomy_database()
+                    os.remove('taxdump.tar.gz')
+
+            with gu.Timer('lineage'):
+                # Get the full lineage of the given taxid
+                lineage = ncbi.get_lineage(args.taxid)
+
+                # Translate all taxids into the names
+                names = ncbi.get_taxid_translator(lineage)
+
+                # Get the ranks for each taxid in the lineage
+                ranks = ncbi.get_rank(lineage)
+
+                # Merge both informations, as a list of tuples
+                my_lineage = [tuple(item) for item in zip(
+                                [ranks[taxid] for taxid in lineage],
+                                [names[taxid] for taxid in lineage])]
+                # Delete ranks named 'no rank'
+                # ## Pop items from the end of the list, otherwise it is a big messed
+                # ## with the indices!
+                # ## The user can choose to drop ranks called "clade"
+
+                for i in range(len(my_lineage) - 1, -1, -1):
+                    # Case where the user asked for a "classic" taxonomy
+                    if args.classic:
+                        if my_lineage[i][0] not in classic_ranks:
+                            del my_lineage[i]
+                    else:
+                        # Make the checks for the other cases
+                        if my_lineage[i][0] == 'no rank':
+                            del my_lineage[i]
+                        if (args.no_clade) and (my_lineage[i][0] == 'clade'):
+                            del my_lineage[i]
+
+            # Print the result
+            if not args.no_header:
+                # Enter this block if user do not specify "--no-header"
+                print_values(my_lineage, add_id=args.id, headers=True,
+                             classic=args.classic)
+            print_values(my_lineage, add_id=args.id, classic=args.classic)
+
+            # This is a way of printing the FULL lineage:
+            #   print('\t'.join([ranks[taxid] for taxid in lineage]))
+            #   print('\t'.join([names[taxid] for taxid in lineage]))
 
     except Exception as e:
         # Something went wrong with the arguments?!
@@ -1,78 +1,314 @@
 #!/usr/bin/env python3
 
 """ This script compute the proportion of informative site in a Fasta alignment,
-for each sequence
+for each sequence. The alignment is held as a matrix of bytes (sequences x
+columns), so large supermatrices can be processed
 """
 
 import os
 import sys
+import glob
+import shutil
 import argparse
+import tempfile
 from argparse import RawTextHelpFormatter
-from Bio import SeqIO
+import numpy as np
 import generic_utils as gu
 
+GAP = ord('-')
+BLOCK_SIZE = 64 * 1024 * 1024  # Bytes of the matrix reduced at once
+CELLS_PER_BLOCK = 16 * 1024 * 1024  # Cells of the matrix counted at once
+# The states of each type of sequence. The other characters, ambiguous or
+# unknown (N, X, ?...), are missing data, and '-' is a gap
+STATES = {'dna': 'ACGT', 'protein': 'ACDEFGHIKLMNPQRSTVWY'}
+COLUMN_FIELDS = ('column', 'gaps', 'occupancy', 'states', 'variable',
+                 'informative', 'entropy', 'majority_freq')
+SUMMARY_FIELDS = ('alignment', 'sequences', 'columns', 'gap_fraction',
+                  'mean_prop_informative', 'min_prop_informative',
+                  'variable_sites', 'informative_sites', 'error')
+# Extensions of the alignments taken from a directory
+ALIGNMENT_EXT = ('.fa', '.fasta', '.fas', '.faa', '.fna', '.aln', '.afa',
+                 '.mfa')
 
-def read_fasta_alignment(file_name):
-    """Read a Fasta file"""
-    # Check
-    gu.is_file_exists(file_name)
 
-    # Read
-    d = {}
-    records = SeqIO.parse(file_name, 'fasta')
-    for record in records:
-        d[record.id] = record.seq
+def length_error(lengths, examples, num_seqs):
+    """Message of the error for sequences of unequal length. 'lengths' is
+    the number of sequences of each length, and 'examples' the first
+    sequence id of each length, both in the order of the file"""
+    most_abundant_length = max(lengths, key=lengths.get)
+    key_for_example = next(size for size in lengths
+                           if size != most_abundant_length)
 
-    return d
+    message = "Some of your sequences have different length. The most " + \
+        "common is " + str(most_abundant_length) + \
+        f", with {lengths[most_abundant_length]}/{num_seqs} sequences.\n"
+    message += "Here is an example of sequence with a different length:\n"
+    message += f" - {examples[key_for_example]} has a length of " + \
+        str(key_for_example)
+    return message
 
 
-def check_seq_length(seq_d):
+def check_seq_length(ids, lengths):
     """Verify that all sequences present in the alignment have the same
     length"""
-
-    sizes = []
-    for seq in seq_d.values():
-        sizes.append(len(seq))
-
-    if len(set(sizes)) > 1:
+    sizes, first, counts = np.unique(lengths, return_index=True,
+                                     return_counts=True)
+    if len(sizes) > 1:
         # There are sequences with unequal length in the alignment
-        # Browse the sequences, get their size, store the ids in a dict
-        aln_d = {}
-        for seqid, seq in seq_d.items():
-            size = len(seq)
-            try:
-                aln_d[size] += [seqid]
-            except KeyError:
-                aln_d[size] = [seqid]
-
-        # Identify the most abudant alignment length
-        most_abundant_length = 0
-        most_abundant_length_name = ''
-        for aln_size, seq_ids in aln_d.items():
-            # print(aln_size, seq_ids)
-            if len(seq_ids) > most_abundant_length:
-                most_abundant_length = len(seq_ids)
-                most_abundant_length_name = aln_size
-
-        message = "Some of your sequences have different length. The most " + \
-            "common is " + str(most_abundant_length_name) + \
-            f", with {most_abundant_length}/{len(seq_d)} sequences.\n"
-        message += "Here is an example of sequence with a different length:\n"
-
-        for k in aln_d:
-            if k != most_abundant_length_name:
-                key_for_example = k
-                break
-        message += f" - {aln_d[key_for_example][0]} has a length of " + \
-            str(key_for_example)
-
-        # Raise the error
-        raise Exception(message)
+        order = np.argsort(first)
+        raise Exception(length_error(
+            dict(zip(sizes[order].tolist(), counts[order].tolist())),
+            {size: ids[i] for size, i in zip(sizes.tolist(),
+                                             first.tolist())},
+            len(ids)))
 
     return True
 
 
-def prop_informative_sites(seq_d, outfile):
+def read_alignment(file_name):
+    """Read a Fasta alignment. Return the sequence ids and the alignment as
+    a 2-D uint8 NumPy matrix, one row per sequence. The sequences are
+    appended to a single buffer, which becomes the matrix without a copy"""
+    # Check
+    if file_name != '-':
+        gu.is_file_exists(file_name)
+
+    # Read
+    ids, lengths, buf = [], [], bytearray()
+    for header, seq in gu.iter_fasta(file_name):
+        ids.append((header.split(None, 1) or [b''])[0].decode())
+        lengths.append(len(seq))
+        buf += seq
+
+    if len(ids) == 0:
+        raise Exception("There is no sequence in the alignment")
+    lengths = np.array(lengths)
+    check_seq_length(ids, lengths)
+    if lengths[0] == 0:
+        raise Exception("The sequences of the alignment are empty")
+
+    return ids, np.frombuffer(buf, dtype=np.uint8).reshape(len(ids),
+                                                           lengths[0])
+
+
+def row_blocks(matrix, block_size=BLOCK_SIZE):
+    """Yield the slices of rows of the matrix to reduce at once, so the
+    temporary arrays stay small whatever the size of the matrix"""
+    step = max(1, block_size // matrix.shape[1])
+    for start in range(0, matrix.shape[0], step):
+        yield slice(start, start + step)
+
+
+def index_blocks(rows, width, block_size=BLOCK_SIZE):
+    """Same as row_blocks() for some rows only, given by their indices"""
+    step = max(1, block_size // width)
+    for start in range(0, len(rows), step):
+        yield rows[start:start + step]
+
+
+def gap_counts(matrix):
+    """Return the number of gaps of each sequence and of each column"""
+    seq_gaps = np.zeros(matrix.shape[0], dtype=np.int64)
+    col_gaps = np.zeros(matrix.shape[1], dtype=np.int64)
+    for rows in row_blocks(matrix):
+        gaps = matrix[rows] == GAP
+        seq_gaps[rows] = np.count_nonzero(gaps, axis=1)
+        col_gaps += np.count_nonzero(gaps, axis=0)
+    return seq_gaps, col_gaps
+
+
+def state_table(seq_type):
+    """Lookup table from the bytes to the codes counted in each column:
+    0 for a gap, 1 for missing data, then 2, 3... for the states, case
+    insensitive. U is the same state as T in DNA"""
+    table = np.ones(256, dtype=np.uint8)
+    table[GAP] = 0
+    for code, state in enumerate(STATES[seq_type], start=2):
+        table[[ord(state), ord(state.lower())]] = code
+    if seq_type == 'dna':
+        table[[ord('U'), ord('u')]] = table[ord('T')]
+    return table
+
+
+def guess_seq_type(matrix):
+    """'dna' if most residues of the first rows are A, C, G, T, U or N,
+    'protein' otherwise"""
+    sample = matrix[:max(1, CELLS_PER_BLOCK // matrix.shape[1])]
+    counts = np.bincount(sample.ravel(), minlength=256)
+    upper = counts[ord('A'):ord('Z') + 1] + counts[ord('a'):ord('z') + 1]
+    nucleotides = sum(upper[ord(base) - ord('A')] for base in 'ACGTUN')
+    return 'dna' if nucleotides >= 0.9 * upper.sum() else 'protein'
+
+
+def column_blocks(matrix):
+    """Yield the slices of columns to count at once"""
+    step = max(1, CELLS_PER_BLOCK // matrix.shape[0])
+    for start in range(0, matrix.shape[1], step):
+        yield slice(start, start + step)
+
+
+def count_states(codes, num_codes):
+    """Count the codes of each column of a block of rows, with a single
+    bincount over (column, code) bins. Return a (columns x codes) array"""
+    width = codes.shape[1]
+    offsets = np.arange(width, dtype=np.int32) * num_codes
+    return np.bincount((codes + offsets).ravel(),
+                       minlength=width * num_codes).reshape(width, num_codes)
+
+
+def empty_statistics(length):
+    """The arrays of the statistics of the columns, see site_statistics()"""
+    return {'gaps': np.zeros(length, dtype=np.int64),
+            'occupancy': np.zeros(length),
+            'states': np.zeros(length, dtype=np.int32),
+            'variable': np.zeros(length, dtype=bool),
+            'informative': np.zeros(length, dtype=bool),
+            'entropy': np.zeros(length),
+            'majority_freq': np.zeros(length)}
+
+
+def fill_statistics(stats, cols, counts, num_seqs):
+    """Compute the statistics of the columns 'cols' from the counts of their
+    codes"""
+    stats['gaps'][cols] = counts[:, 0]
+    stats['occupancy'][cols] = 1 - counts[:, 0] / num_seqs
+    counts = counts[:, 2:]
+    residues = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        freqs = counts / residues[:, None]
+        stats['entropy'][cols] = np.where(
+            counts > 0, freqs * np.log2(1 / freqs), 0).sum(axis=1)
+        stats['majority_freq'][cols] = np.nan_to_num(freqs.max(axis=1))
+    stats['states'][cols] = np.count_nonzero(counts, axis=1)
+    stats['variable'][cols] = stats['states'][cols] >= 2
+    stats['informative'][cols] = np.count_nonzero(counts >= 2, axis=1) >= 2
+    return stats
+
+
+def site_statistics(matrix, seq_type):
+    """Count the states of each column, with a single bincount per block of
+    columns, and return the statistics of the columns (COLUMN_FIELDS) as
+    NumPy arrays:
+        - 'states': number of different states, gaps and missing data
+          excluded
+        - 'variable': at least two states
+        - 'informative': parsimony-informative, i.e. at least two states
+          present at least twice each
+        - 'entropy': Shannon entropy of the states, in bits
+        - 'majority_freq': frequency of the most common state, among the
+          sequences with a state
+    Also return the number of gaps of each sequence"""
+    table = state_table(seq_type)
+    num_codes = len(STATES[seq_type]) + 2
+    num_seqs, length = matrix.shape
+    seq_gaps = np.zeros(num_seqs, dtype=np.int64)
+    stats = empty_statistics(length)
+
+    for cols in column_blocks(matrix):
+        codes = table[matrix[:, cols]]
+        seq_gaps += np.count_nonzero(codes == 0, axis=1)
+        fill_statistics(stats, cols, count_states(codes, num_codes), num_seqs)
+    return seq_gaps, stats
+
+
+def stream_alignment(file_name, fo, seq_type='auto', columns=False):
+    """Streaming mode, for the alignments too large for the memory: the
+    sequences are read one by one, and the proportion of informative sites
+    of each is written to 'fo' as soon as it is read. The length of each
+    sequence is checked as it is read, and the first one with a different
+    length is reported. With 'columns', the
+    sequences are also gathered by blocks of rows, whose states are added
+    to a memory-mapped (columns x codes) accumulator. The memory used does
+    not depend on the number of sequences.
+    Return the statistics of the columns (None without 'columns') and the
+    type of sequences"""
+    if file_name != '-':
+        gu.is_file_exists(file_name)
+
+    length, num_seqs, block, counts = None, 0, bytearray(), None
+
+    def _add_block(block, seq_type, counts):
+        """Add the states of a block of rows to the accumulator"""
+        block = np.frombuffer(block, dtype=np.uint8).reshape(-1, length)
+        if seq_type == 'auto':
+            seq_type = guess_seq_type(block)
+        num_codes = len(STATES[seq_type]) + 2
+        if counts is None:
+            counts = np.memmap(tempfile.TemporaryFile(), dtype=np.int64,
+                               mode='w+', shape=(length, num_codes))
+        table = state_table(seq_type)
+        for cols in column_blocks(block):
+            counts[cols] += count_states(table[block[:, cols]], num_codes)
+        return seq_type, counts
+
+    print("seq_id", "prop_informative_site", sep="\t", file=fo)
+    for header, seq in gu.iter_fasta(file_name):
+        seq_id = (header.split(None, 1) or [b''])[0].decode()
+        if length is None:
+            length = len(seq)
+            if length == 0:
+                raise Exception("The sequences of the alignment are empty")
+        if len(seq) != length:
+            raise Exception("Some of your sequences have different length. "
+                            f"The first {num_seqs} sequence(s) have a "
+                            f"length of {length}.\nHere is the first "
+                            "sequence with a different length:\n - "
+                            f"{seq_id} has a length of {len(seq)}")
+        num_seqs += 1
+
+        print(seq_id, str(1 - seq.count(b'-') / length), sep='\t', file=fo)
+        if columns:
+            block += seq
+            if len(block) >= BLOCK_SIZE:
+                seq_type, counts = _add_block(block, seq_type, counts)
+                block = bytearray()
+
+    if num_seqs == 0:
+        raise Exception("There is no sequence in the alignment")
+    if not columns:
+        return None, seq_type
+    if block:
+        seq_type, counts = _add_block(block, seq_type, counts)
+
+    stats = empty_statistics(length)
+    step = max(1, CELLS_PER_BLOCK // counts.shape[1])
+    for start in range(0, length, step):
+        cols = slice(start, start + step)
+        fill_statistics(stats, cols, np.asarray(counts[cols]), num_seqs)
+    return stats, seq_type
+
+
+def stream_to_output(file_name, outfile, seq_type='auto', columns=False):
+    """Run stream_alignment() with its table written to a temporary file,
+    moved to 'outfile' (or copied to STDOUT) only once the whole alignment
+    is checked, so a bad alignment leaves no partial table"""
+    out_dir = os.path.dirname(os.path.abspath(outfile)) if outfile else None
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=out_dir,
+                                     prefix='.', suffix='.tmp',
+                                     delete=False) as fo:
+        try:
+            result = stream_alignment(file_name, fo, seq_type, columns)
+        except BaseException:
+            os.remove(fo.name)
+            raise
+
+    if outfile:
+        os.replace(fo.name, outfile)
+    else:
+        with open(fo.name, encoding='utf-8') as fi:
+            shutil.copyfileobj(fi, sys.stdout)
+        os.remove(fo.name)
+    return result
+
+
+def site_summary(stats):
+    """Number of columns, of variable and of parsimony-informative sites"""
+    return {'columns': len(stats['gaps']),
+            'variable': int(np.count_nonzero(stats['variable'])),
+            'informative': int(np.count_nonzero(stats['informative']))}
+
+
+def prop_informative_sites(ids, seq_gaps, length, outfile):
     """Compute the proportion of informative sites aka 
     1 - (number gaps / alignment length)"""
 
@@ -85,9 +321,7 @@ def prop_informative_sites(seq_d, outfile):
     print("seq_id", "prop_informative_site", sep="\t", file=fo)
 
     # Body
-    for seqid, seq in seq_d.items():
-        gaps = len(seq) - len(seq.replace('-', ''))  # Full - without gaps
-        prop_informative = 1 - (gaps / len(seq))
+    for seqid, prop_informative in zip(ids, (1 - seq_gaps / length).tolist()):
         print(seqid, str(prop_informative), sep='\t', file=fo)
 
     if outfile:
@@ -96,12 +330,163 @@ def prop_informative_sites(seq_d, outfile):
     return True
 
 
+def write_site_statistics(stats, outfile):
+    """Write the statistics of each column, numbered from 1, see
+    site_statistics()"""
+    flags = np.array(['0', '1'])
+    columns = [map(str, range(1, len(stats['gaps']) + 1)),
+               map(str, stats['gaps'].tolist()),
+               map(str, stats['occupancy'].tolist()),
+               map(str, stats['states'].tolist()),
+               flags[stats['variable'].view(np.int8)].tolist(),
+               flags[stats['informative'].view(np.int8)].tolist(),
+               map(str, np.round(stats['entropy'], 4).tolist()),
+               map(str, np.round(stats['majority_freq'], 4).tolist())]
+    with open(outfile, 'w', encoding='utf-8') as fo:
+        print(*COLUMN_FIELDS, sep="\t", file=fo)
+        fo.writelines(row + '\n' for row in map('\t'.join, zip(*columns)))
+    return True
+
+
+def trim_masks(matrix, seq_gaps, col_gaps, max_gaps=0.5, min_informative=0):
+    """Return the boolean masks of the sequences and of the columns to keep:
+    the sequences with a proportion of informative sites of at least
+    'min_informative', then the columns with a fraction of gaps of at most
+    'max_gaps' among these sequences"""
+    length = matrix.shape[1]
+    seq_keep = 1 - seq_gaps / length >= min_informative
+    if not seq_keep.any():
+        raise Exception("No sequence left after trimming, see "
+                        "--min_informative")
+
+    # Only the gaps of the sequences kept count, remove the others
+    col_gaps = col_gaps.copy()
+    for rows in index_blocks(np.flatnonzero(~seq_keep), length):
+        col_gaps -= np.count_nonzero(matrix[rows] == GAP, axis=0)
+    col_keep = col_gaps / np.count_nonzero(seq_keep) <= max_gaps
+    return seq_keep, col_keep
+
+
+def write_trimmed(ids, matrix, seq_keep, col_keep, outfile):
+    """Write the sequences and the columns kept, one sequence per line.
+    The output is compressed according to its extension"""
+    with gu.open_output(outfile) as fo:
+        for rows in index_blocks(np.flatnonzero(seq_keep), len(col_keep)):
+            block = np.compress(col_keep, matrix[rows], axis=1)
+            fo.write(b''.join(b'>%s\n%s\n' % (ids[i].encode(), seq.tobytes())
+                              for i, seq in zip(rows.tolist(), block)))
+    return True
+
+
+def alignment_summary(task):
+    """Read an alignment and return its ids, the proportion of informative
+    sites of its sequences and, if asked, its summary (SUMMARY_FIELDS), for
+    which the column statistics are computed. An error is returned with the
+    summary, the batch goes on"""
+    file_name, seq_type, with_summary = task
+    try:
+        ids, matrix = read_alignment(file_name)
+        if not with_summary:
+            seq_gaps, _ = gap_counts(matrix)
+            return ids, (1 - seq_gaps / matrix.shape[1]).tolist(), None, None
+        if seq_type == 'auto':
+            seq_type = guess_seq_type(matrix)
+        seq_gaps, stats = site_statistics(matrix, seq_type)
+        props = 1 - seq_gaps / matrix.shape[1]
+        sites = site_summary(stats)
+        summary = [file_name, len(ids), matrix.shape[1],
+                   round(seq_gaps.sum() / matrix.size, 4),
+                   round(props.mean(), 4), round(props.min(), 4),
+                   sites['variable'], sites['informative'], '']
+        return ids, props.tolist(), summary, None
+    except Exception as e:
+        error = ' '.join(str(e).split())  # On a single line
+        return None, None, [file_name] + ['NA'] * 7 + [error], error
+
+
+def run_batch(alignments, seq_type='auto', threads=1, outfile=None,
+              summary_file=None):
+    """Process several alignments, in parallel with 'threads'. Write the
+    proportion of informative sites of all sequences in a single table, and
+    the summary of each alignment in 'summary_file'. The errors are
+    reported and the other alignments processed. Return the number of
+    alignments that failed"""
+    tasks = [(aln, seq_type, bool(summary_file)) for aln in alignments]
+    results = gu.ordered_map(alignment_summary, tasks, threads)
+
+    fo = open(outfile, 'w', encoding='utf-8') if outfile else sys.stdout
+    summary = open(summary_file, 'w', encoding='utf-8') if summary_file \
+        else None
+    print("alignment", "seq_id", "prop_informative_site", sep="\t", file=fo)
+    if summary:
+        print(*SUMMARY_FIELDS, sep="\t", file=summary)
+
+    failed = 0
+    with gu.Timer('batch') as timer:
+        for aln, (ids, props, values, error) in zip(alignments, results):
+            timer.count(nbytes=0 if aln == '-' else os.path.getsize(aln),
+                        records=1)
+            if summary:
+                print(*values, sep="\t", file=summary)
+            if error:
+                print(f"{aln}: {error}", file=sys.stderr)
+                failed += 1
+                continue
+            fo.writelines(f"{aln}\t{seq_id}\t{prop}\n"
+                          for seq_id, prop in zip(ids, props))
+
+    if outfile:
+        fo.close()
+    if summary:
+        summary.close()
+    return failed
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
-    parser.add_argument('alignment', help='Alignment file, in Fasta')
+    parser.add_argument('alignment', help='Alignment file, in Fasta, can be '
+                        'compressed. "-" for STDIN.\nSeveral files, '
+                        'directories or glob patterns can\nbe given for the '
+                        'batch mode', nargs='*')
+    parser.add_argument('--fofn', help='A file with the path of one alignment '
+                        'per line', metavar="")
     parser.add_argument('-o', help='File to write the results. Default is '
-                        'STDOUT', required = False, metavar="")
+                        'STDOUT\nIn batch mode, a single table with the '
+                        'alignment\nof each sequence', required = False,
+                        metavar="")
+    parser.add_argument('--summary', help='In batch mode, file to write a '
+                        'summary of each alignment,\nand the errors',
+                        metavar="")
+    parser.add_argument('-t', '--threads', help='Number of alignments '
+                        'processed in parallel - [1]', default=1, type=int,
+                        metavar="")
+    parser.add_argument('--force', help='Overwrite the output files',
+                        default=False, action='store_true')
+    parser.add_argument('--columns', help='File to write the statistics of '
+                        'each column: gaps,\noccupancy, number of states, '
+                        'variable and parsimony-\ninformative sites, entropy '
+                        'and frequency of the\nmajority state. The number of '
+                        'variable and informative\nsites is printed to '
+                        'STDERR', metavar="")
+    parser.add_argument('--type', help='Type of sequences, to know the states '
+                        '- [auto]', choices=['auto', 'dna', 'protein'],
+                        default='auto')
+    parser.add_argument('--trim', help='File to write the alignment without '
+                        'the gappy columns\nand sequences, can be compressed '
+                        '(.gz, .bz2, .xz)', metavar="")
+    parser.add_argument('--max_gaps', help='With --trim, maximum fraction of '
+                        'gaps of a column - [0.5]', default=0.5, type=float,
+                        metavar="")
+    parser.add_argument('--min_informative', help='With --trim, minimum '
+                        'proportion of informative sites\nof a sequence - '
+                        '[0]', default=0, type=float, metavar="")
+    parser.add_argument('--streaming', help='Read the sequences one by one, '
+                        'for an alignment too\nlarge for the memory. The '
+                        'column statistics are\naccumulated in a temporary '
+                        'file. Not with --trim', default=False,
+                        action='store_true')
+    gu.add_profile_arguments(parser)
 
     args = parser.parse_args()
 
@@ -110,16 +495,90 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        # Read, check alignment and outfile if provided
-        seqs = read_fasta_alignment(args.alignment)
-        check_seq_length(seqs)
-        if args.o:
-            if os.path.exists(args.o):
-                raise FileExistsError('Outfile exists but this script does not'
-                                      'overwright things')
-
-        # The core of this script
-        prop_informative_sites(seqs, args.o)
+        with gu.Profiler(args.profile, args.cprofile):
+            for outfile in (args.o, args.columns, args.trim, args.summary):
+                if outfile and os.path.exists(outfile) and not args.force:
+                    raise FileExistsError('Outfile exists but this script '
+                                          'does not overwright things, see '
+                                          '--force')
+
+            alignments = gu.list_input_files(args.alignment, ALIGNMENT_EXT,
+                                             args.fofn, 'alignment')
+            batch = args.fofn or len(args.alignment) > 1 or \
+                any(os.path.isdir(path) or glob.has_magic(path)
+                    for path in args.alignment)
+            if batch and (args.columns or args.trim):
+                raise Exception("--columns and --trim work on a single "
+                                "alignment")
+            if not batch and args.summary:
+                raise Exception("--summary works in batch mode only")
+            if args.streaming and (batch or args.trim):
+                raise Exception("--streaming works on a single alignment, "
+                                "without --trim")
+
+            if batch:
+                failed = run_batch(alignments, args.type, args.threads,
+                                   args.o, args.summary)
+                if failed:
+                    raise Exception(f"{failed}/{len(alignments)} alignments "
+                                    "failed")
+
+            elif args.streaming:
+                with gu.Timer('stream') as timer:
+                    stats, seq_type = stream_to_output(
+                        alignments[0], args.o, args.type, args.columns)
+                    if alignments[0] != '-':
+                        timer.count(nbytes=os.path.getsize(alignments[0]))
+
+                if args.columns:
+                    with gu.Timer('write'):
+                        write_site_statistics(stats, args.columns)
+                    summary = site_summary(stats)
+                    print(f"{summary['columns']} columns ({seq_type}), "
+                          f"{summary['variable']} variable sites, "
+                          f"{summary['informative']} "
+                          "parsimony-informative sites", file=sys.stderr)
+
+            else:
+                # Read and check the alignment
+                with gu.Timer('read') as timer:
+                    ids, matrix = read_alignment(alignments[0])
+                    timer.count(nbytes=matrix.nbytes, records=len(ids))
+
+                # The core of this script
+                with gu.Timer('compute') as timer:
+                    if args.columns:
+                        seq_type = guess_seq_type(matrix) \
+                            if args.type == 'auto' else args.type
+                        seq_gaps, stats = site_statistics(matrix, seq_type)
+                        col_gaps = stats['gaps']
+                    else:
+                        seq_gaps, col_gaps = gap_counts(matrix)
+                    timer.count(nbytes=matrix.nbytes, records=len(ids))
+
+                if args.trim:
+                    with gu.Timer('trim') as timer:
+                        seq_keep, col_keep = trim_masks(
+                            matrix, seq_gaps, col_gaps, args.max_gaps,
+                            args.min_informative)
+                        write_trimmed(ids, matrix, seq_keep, col_keep,
+                                      args.trim)
+                        timer.count(nbytes=matrix.nbytes, records=len(ids))
+                    print(f"Trimmed alignment: {np.count_nonzero(seq_keep)}"
+                          f"/{len(ids)} sequences and "
+                          f"{np.count_nonzero(col_keep)}/{len(col_keep)} "
+                          "columns kept", file=sys.stderr)
+
+                with gu.Timer('write'):
+                    prop_informative_sites(ids, seq_gaps, matrix.shape[1],
+                                           args.o)
+                    if args.columns:
+                        write_site_statistics(stats, args.columns)
+                        summary = site_summary(stats)
+                        print(f"{summary['columns']} columns ({seq_type}), "
+                              f"{summary['variable']} variable sites, "
+                              f"{summary['informative']} "
+                              "parsimony-informative sites", file=sys.stderr)
 
     except Exception as e:
         # Something went wrong with the arguments?!
@@ -8,6 +8,7 @@ import random
 import hashlib
 import argparse
 from argparse import RawTextHelpFormatter
+import generic_utils as gu
 
 # Define the four nucleotides
 NUCLEOTIDES = ["A", "T", "C", "G"]
@@ -24,6 +25,7 @@ if __name__ == "__main__":
         metavar="",
         required=False,
     )
+    gu.add_profile_arguments(parser)
     args = parser.parse_args()
 
     ## The lines bellow made the script unusable
@@ -32,15 +34,20 @@ if __name__ == "__main__":
     #     sys.exit(1)
 
     try:
-        # Generate the sequence
-        dna_sequence = "".join(random.choices(NUCLEOTIDES, k=args.l))
+        with gu.Profiler(args.profile, args.cprofile):
+            # Generate the sequence
+            with gu.Timer('generate') as timer:
+                dna_sequence = "".join(random.choices(NUCLEOTIDES, k=args.l))
+                timer.count(nbytes=args.l)
 
-        # Generate a unique name for the sequence, with SHA256 HASH function
-        seq_name = hashlib.sha256(dna_sequence.encode("utf-8")).hexdigest()
+            # Generate a unique name for the sequence, with SHA256 HASH
+            # function
+            seq_name = hashlib.sha256(dna_sequence.encode("utf-8")).hexdigest()
 
-        # Print to STDOUT
-        print(">", seq_name, sep="")
-        print(dna_sequence)
+            # Print to STDOUT
+            with gu.Timer('write'):
+                print(">", seq_name, sep="")
+                print(dna_sequence)
 
     except Exception as e:
         # Something went wrong with the arguments?!